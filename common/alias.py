@@ -0,0 +1,303 @@
+from dataflow import Interner, solve_bitvector
+from ir import Instr
+
+# Allocation-site points-to analysis. Every `alloc` instruction is one
+# abstract object; UNKNOWN stands for memory the function did not allocate
+# (reached through parameters, call results or pointers loaded from such
+# memory), which may also be any object of ours that escaped to a caller or
+# callee.
+UNKNOWN = '?'
+
+def clobbers_memory(instr, effects):
+    # Writes memory other than by a store: freeing it, or calling code that
+    # might do anything
+    op = instr.get('op')
+    return op == 'free' or op == 'call' and not effects.is_pure(instr)
+
+def is_pointer(t):
+    return isinstance(t, dict) and 'ptr' in t
+
+def constant_ints(cfg):
+    # Variables whose every definition is the same integer constant
+    values = {}
+    for block in cfg.blocks.values():
+        for instr in block:
+            dest = instr.get('dest')
+            if dest is None:
+                continue
+            value = instr.get('value') if instr.get('op') == 'const' and instr.get('type') == 'int' else None
+            if values.get(dest, value) != value:
+                value = None
+            values[dest] = value
+    return {var: value for var, value in values.items() if value is not None}
+
+class PointsTo:
+    # Flow-insensitive (Andersen-style) over variable names: the points-to
+    # set of a variable covers every value it holds anywhere in the
+    # function, so queries are sound at any program point, whichever
+    # definition reached it.
+    #
+    #   sites     (label, index) of each alloc
+    #   pts       pointer variable -> set of sites (and maybe UNKNOWN)
+    #   contents  site -> what pointers stored into that object point to
+    #   escaped   sites a call, a return or unknown memory can reach
+    #   summary   sites in a block on a CFG cycle (natural loop or
+    #             irreducible, see cyclic_blocks in loops.py), which stand for
+    #             more than one object
+    #   offsets   pointer variable -> (site, constant offset) when every
+    #             definition agrees on both
+    def __init__(self, cfg, args, cyclic):
+        self.sites = []
+        self.pts = {}
+        self.contents = {}
+        self.escaped = set()
+        self.summary = set()
+        self.offsets = {}
+
+        instrs = []
+        for label, block in cfg.blocks.items():
+            for i, instr in enumerate(block):
+                instrs.append(instr)
+                if instr.get('op') == 'alloc':
+                    site = (label, i)
+                    self.sites.append(site)
+                    if label in cyclic:
+                        self.summary.add(site)
+                    self.pts.setdefault(instr['dest'], set()).add(site)
+        for arg in args:
+            if is_pointer(arg.get('type')):
+                self.pts.setdefault(arg['name'], set()).add(UNKNOWN)
+
+        # Plain fixpoint iteration; the sets only grow, and functions are small
+        changed = True
+        while changed:
+            changed = False
+            for instr in instrs:
+                if self.transfer(instr):
+                    changed = True
+        self.compute_offsets(cfg, args)
+
+    def points_to(self, var):
+        return self.pts.get(var, set())
+
+    def add(self, var, targets):
+        current = self.pts.setdefault(var, set())
+        if targets <= current:
+            return False
+        current |= targets
+        return True
+
+    def escape(self, targets):
+        # Everything reachable from an escaped object escapes with it
+        stack = [site for site in targets if site != UNKNOWN and site not in self.escaped]
+        changed = bool(stack)
+        while stack:
+            site = stack.pop()
+            if site in self.escaped:
+                continue
+            self.escaped.add(site)
+            stack.extend(s for s in self.contents.get(site, ()) if s != UNKNOWN)
+        return changed
+
+    def reaches_unknown(self, targets):
+        return UNKNOWN in targets or not targets.isdisjoint(self.escaped)
+
+    def transfer(self, instr):
+        if type(instr) is Instr:
+            op, dest, args, t = instr.op, instr.dest_name(), instr.decoded_args() or (), instr.type
+        else:
+            op, dest, args, t = instr.get('op'), instr.get('dest'), instr.get('args', ()), instr.get('type')
+        pointer = is_pointer(t)
+        if op in ('id', 'ptradd', 'phi') and pointer:
+            targets = set()
+            for arg in (args if op == 'phi' else args[:1]):
+                targets |= self.points_to(arg)
+            return self.add(dest, targets)
+        if op == 'load' and pointer:
+            address = self.points_to(args[0])
+            targets = set()
+            for site in address:
+                targets |= self.contents.get(site, set())
+            if self.reaches_unknown(address):
+                targets.add(UNKNOWN)
+            return self.add(dest, targets)
+        if op == 'store' and len(args) == 2 and self.points_to(args[1]):
+            address, value = self.points_to(args[0]), self.points_to(args[1])
+            changed = False
+            for site in address:
+                if site == UNKNOWN:
+                    continue
+                contents = self.contents.setdefault(site, set())
+                if not value <= contents:
+                    contents |= value
+                    changed = True
+                    if site in self.escaped:
+                        self.escape(value)
+            if self.reaches_unknown(address):
+                changed = self.escape(value) or changed
+            return changed
+        if op == 'call':
+            changed = False
+            for arg in args:
+                changed = self.escape(self.points_to(arg)) or changed
+            if dest is not None and pointer:
+                changed = self.add(dest, {UNKNOWN}) or changed
+            return changed
+        if op == 'ret' and args:
+            return self.escape(self.points_to(args[0]))
+        if dest is not None and pointer and op != 'alloc':
+            # Some operation we do not model produced a pointer
+            return self.add(dest, {UNKNOWN})
+        return False
+
+    def compute_offsets(self, cfg, args):
+        constants = constant_ints(cfg)
+        conflict = object()
+        # Parameters point who knows where
+        offsets = {arg['name']: conflict for arg in args if arg['name'] in self.pts}
+
+        def merge(var, offset):
+            old = offsets.get(var)
+            if old is conflict or old == offset:
+                return False
+            offsets[var] = offset if old is None else conflict
+            return True
+
+        defs = [((label, i), instr) for label, block in cfg.blocks.items() for i, instr in enumerate(block)
+                if 'dest' in instr and instr['dest'] in self.pts]
+        changed = True
+        while changed:
+            changed = False
+            for site, instr in defs:
+                op, dest, args = instr.get('op'), instr['dest'], instr.get('args', [])
+                if op == 'alloc':
+                    offset = (site, 0)
+                elif op == 'id':
+                    offset = offsets.get(args[0])
+                elif op == 'ptradd' and args[1] in constants:
+                    base = offsets.get(args[0])
+                    offset = base if base in (None, conflict) else (base[0], base[1] + constants[args[1]])
+                else:
+                    offset = conflict
+                if offset is not None and merge(dest, offset):
+                    changed = True
+        self.offsets = {var: offset for var, offset in offsets.items() if offset is not conflict}
+
+    def may_alias(self, p, q):
+        # Could p and q address the same memory cell? Variables the analysis
+        # knows nothing about may alias anything.
+        a, b = self.pts.get(p), self.pts.get(q)
+        if not a or not b:
+            return True
+        if not a.isdisjoint(b):
+            if (p in self.offsets and q in self.offsets and self.offsets[p] != self.offsets[q]
+                    and self.offsets[p][0] not in self.summary):
+                # Different cells of the same single object
+                return False
+            return True
+        return (UNKNOWN in a and self.reaches_unknown(b)) or (UNKNOWN in b and self.reaches_unknown(a))
+
+    def must_alias(self, p, q):
+        # Do p and q address the same cell whenever both are defined? True
+        # for one variable, or for the same constant offset into an object
+        # allocated at most once per call.
+        if p == q:
+            return True
+        offset = self.offsets.get(p)
+        return offset is not None and offset == self.offsets.get(q) and offset[0] not in self.summary
+
+class NoAliasInfo:
+    # Stand-in when no analysis is available: anything may alias anything
+    def may_alias(self, p, q):
+        return True
+
+    def must_alias(self, p, q):
+        return p == q
+
+class MemoryLiveness:
+    # Backward liveness over the memory cells of objects that do not escape,
+    # for finding stores nothing reads. A cell is (site, offset) for an
+    # address the analysis pins down exactly; an access it cannot pin down
+    # uses the whole object. Escaped and unknown memory is always live, so
+    # calls, which can only reach that memory, do not matter here.
+    #
+    #   load a     reads a's cell, or every object a may point to
+    #   store a v  kills a's cell when it is exact; is observed by a later
+    #              read of that cell or of its object
+    #   free a     kills everything in a's object, when a surely points to
+    #              one object allocated once
+    def __init__(self, cfg, points_to):
+        self.cfg = cfg
+        self.points_to = points_to
+        self.interner = Interner()
+        bit = self.interner.bit
+
+        # Every exactly addressed cell of each object, so an inexact store
+        # can be checked against all of them
+        self.cells = {}
+        for block in cfg.blocks.values():
+            for instr in block:
+                if instr.get('op') in ('load', 'store'):
+                    cell = self.exact(instr['args'][0])
+                    if cell is not None:
+                        self.cells[cell[0]] = self.cells.get(cell[0], 0) | bit(cell)
+
+        gen, kill = {}, {}
+        for label, block in cfg.blocks.items():
+            g = k = 0
+            for instr in reversed(block):
+                reads, kills = self.transfer(instr)
+                g = reads | (g & ~kills)
+                k |= kills
+            gen[label], kill[label] = g, k
+        self.live_in, self.live_out = solve_bitvector(cfg, gen, kill, forward=False)
+
+    def exact(self, address):
+        offset = self.points_to.offsets.get(address)
+        if offset is None or offset[0] in self.points_to.summary:
+            return None
+        return offset
+
+    def objects(self, address):
+        # The objects behind an address, or None if that may include memory
+        # someone else can see
+        targets = self.points_to.points_to(address)
+        if not targets or self.points_to.reaches_unknown(targets):
+            return None
+        return targets
+
+    def transfer(self, instr):
+        # (bits read, bits killed) by one instruction
+        op = instr.get('op')
+        bit = self.interner.bit
+        if op == 'load':
+            cell = self.exact(instr['args'][0])
+            if cell is not None:
+                return bit(cell), 0
+            targets = self.points_to.points_to(instr['args'][0])
+            return self.interner.bits(('object', site) for site in targets), 0
+        if op == 'store':
+            cell = self.exact(instr['args'][0])
+            return 0, (bit(cell) if cell is not None else 0)
+        if op == 'free':
+            targets = self.objects(instr['args'][0])
+            if targets is not None and len(targets) == 1:
+                site = next(iter(targets))
+                if site not in self.points_to.summary:
+                    return 0, bit(('object', site)) | self.cells.get(site, 0)
+        return 0, 0
+
+    def observers(self, instr):
+        # Bits that, live after this store, mean something may read what it
+        # wrote; None when it writes memory that outlives the function
+        address = instr['args'][0]
+        targets = self.objects(address)
+        if targets is None:
+            return None
+        cell = self.exact(address)
+        if cell is not None:
+            return self.interner.bit(cell) | self.interner.bit(('object', cell[0]))
+        bits = 0
+        for site in targets:
+            bits |= self.interner.bit(('object', site)) | self.cells.get(site, 0)
+        return bits
@@ -0,0 +1,71 @@
+import instrument
+from alias import PointsTo
+from callgraph import UNKNOWN_EFFECTS
+from cfg import CFG
+from dataflow import DefinedVariables, Liveness, ReachingDefinitions
+from dominators import compute_dominators, compute_post_dominators
+from loops import LoopForest, cyclic_blocks, find_natural_loops
+from ssa import def_use_chains
+
+# Analyses are computed lazily and cached until a pass fails to preserve them.
+# Everything is derived from the CFG, so dropping 'cfg' drops the lot.
+ANALYSES = {
+    'cfg': lambda am: CFG(am.func),
+    'dominators': lambda am: compute_dominators(am.get('cfg')),
+    'post_dominators': lambda am: compute_post_dominators(am.get('cfg')),
+    'loops': lambda am: find_natural_loops(am.get('cfg'), am.get('dominators')),
+    'cyclic_blocks': lambda am: cyclic_blocks(am.get('cfg')),
+    'loop_forest': lambda am: LoopForest(am.get('cfg'), am.get('dominators'), am.get('loops')),
+    'liveness': lambda am: Liveness(am.get('cfg')),
+    'def_use': lambda am: def_use_chains(am.get('cfg')),
+    'defined_variables': lambda am: DefinedVariables(
+        am.get('cfg'), [arg['name'] for arg in am.func.get('args', [])]),
+    'reaching_definitions': lambda am: ReachingDefinitions(
+        am.get('cfg'), [arg['name'] for arg in am.func.get('args', [])]),
+    'points_to': lambda am: PointsTo(
+        am.get('cfg'), am.func.get('args', []), am.get('cyclic_blocks')),
+}
+
+# Analyses that only depend on the shape of the CFG; a pass that rewrites
+# straight-line code without touching terminators preserves all of them.
+# (loop_forest is not one: it also summarizes the loops' defs and uses.)
+CFG_ANALYSES = frozenset({'cfg', 'dominators', 'post_dominators', 'loops', 'cyclic_blocks'})
+
+class AnalysisManager:
+    # `effects` summarizes the other functions of the program (see
+    # callgraph.py); passes run on a lone function treat every call as opaque
+    def __init__(self, func, effects=UNKNOWN_EFFECTS):
+        self.func = func
+        self.effects = effects
+        self.cache = {}
+        self.cfg_handed_out = False
+        self.built_from = None
+
+    def get(self, name):
+        if name not in self.cache:
+            if name == 'cfg':
+                self.built_from = self.func.get('instrs')
+            with instrument.scope('analysis', name, self.func.get('name')):
+                self.cache[name] = ANALYSES[name](self)
+        if name == 'cfg':
+            # Whoever asked for the CFG may edit its blocks in place
+            self.cfg_handed_out = True
+        return self.cache[name]
+
+    def sync(self):
+        # Write the (possibly edited) cached CFG back to func['instrs'], unless
+        # a pass already replaced the body outright -- then the CFG is the stale one
+        if 'cfg' in self.cache and self.func.get('instrs') is not self.built_from:
+            self.cache.clear()
+        elif self.cfg_handed_out and 'cfg' in self.cache:
+            self.func['instrs'] = self.built_from = self.cache['cfg'].to_instrs()
+        self.cfg_handed_out = False
+
+    def invalidate(self, preserved=()):
+        if 'cfg' not in preserved:
+            self.sync()
+            self.cache.clear()
+            return
+        for name in list(self.cache):
+            if name not in preserved:
+                del self.cache[name]
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+import argparse
+import copy
+import glob
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from analysis import ANALYSES, AnalysisManager
+from bril_gen import SHAPES, generate
+from pipeline import PASSES
+
+# Compile-time benchmarks: how long each analysis and pass takes, and how
+# much memory it allocates at peak, on real programs and on synthetic ones of
+# growing size from bril_gen. Results are JSON; `--max-exponent` turns the scaling fit into
+# a pass/fail check for super-linear regressions.
+
+# Passes that only make sense on the output of another pass
+SETUP = {'from_ssa': ('to_ssa',)}
+
+def load_program(path):
+    if path.endswith('.json'):
+        with open(path) as f:
+            return json.load(f)
+    with open(path) as f:
+        result = subprocess.run(['bril2json'], stdin=f, capture_output=True, text=True, check=True)
+    return json.loads(result.stdout)
+
+def program_size(prog):
+    return sum(1 for func in prog.get('functions', []) for instr in func['instrs'] if 'op' in instr)
+
+def prepare(prog, name):
+    prog = copy.deepcopy(prog)
+    for setup in SETUP.get(name, ()):
+        for func in prog.get('functions', []):
+            am = AnalysisManager(func)
+            PASSES[setup][1](func, am)
+            am.sync()
+    return prog
+
+def run_once(prog, kind, name, measure):
+    # Everything not being measured (copying, building the CFG an analysis
+    # sits on) happens before `measure` starts
+    if kind == 'pass' and PASSES[name][0] == 'program':
+        prog = prepare(prog, name)
+        with measure:
+            PASSES[name][1](prog)
+        return
+    prog = prepare(prog, name) if kind == 'pass' else copy.deepcopy(prog)
+    managers = [AnalysisManager(func) for func in prog.get('functions', [])]
+    if kind == 'analysis' and name != 'cfg':
+        for am in managers:
+            am.get('cfg')
+    with measure:
+        for am in managers:
+            if kind == 'analysis':
+                am.get(name)
+            else:
+                PASSES[name][1](am.func, am)
+                am.sync()
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
+
+class PeakMemory:
+    def __enter__(self):
+        tracemalloc.start()
+
+    def __exit__(self, *exc):
+        self.peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+def measure(prog, kind, name, repeat):
+    # Best of `repeat` timings; memory in a separate run since tracing
+    # slows everything down
+    try:
+        seconds = []
+        for _ in range(repeat):
+            timer = Timer()
+            run_once(prog, kind, name, timer)
+            seconds.append(timer.seconds)
+        memory = PeakMemory()
+        run_once(prog, kind, name, memory)
+    except Exception as e:
+        return {'error': f"{type(e).__name__}: {e}"}
+    return {'seconds': min(seconds), 'peak_bytes': memory.peak}
+
+def scaling_exponent(points):
+    # Least-squares slope of log(time) against log(size): about 1 for
+    # linear work, 2 for quadratic
+    points = [(math.log(size), math.log(seconds)) for size, seconds in points if seconds > 0]
+    if len(points) < 2:
+        return None
+    mean_x = sum(x for x, _ in points) / len(points)
+    mean_y = sum(y for _, y in points) / len(points)
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if var == 0:
+        return None
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure the compile time and memory of passes and analyses.')
+    parser.add_argument('inputs', nargs='*',
+                        help='Bril programs (.json, or .bril when bril2json is installed) or globs')
+    parser.add_argument('--passes', default=','.join(PASSES),
+                        help='comma-separated passes to measure')
+    parser.add_argument('--analyses', default=','.join(ANALYSES),
+                        help='comma-separated analyses to measure')
+    parser.add_argument('--scale', default='50,100,200,400',
+                        help='sizes of the synthetic scaling inputs (see bril_gen.py); empty for none')
+    parser.add_argument('--shapes', default='loops',
+                        help=f"comma-separated synthetic shapes ({', '.join(SHAPES)})")
+    parser.add_argument('--repeat', type=int, default=3, help='timing runs per measurement')
+    parser.add_argument('--max-exponent', type=float,
+                        help='exit 1 if any scaling exponent is above this')
+    parser.add_argument('--output', help='write results here instead of stdout')
+    args = parser.parse_args()
+
+    targets = [('analysis', name) for name in args.analyses.split(',') if name]
+    targets += [('pass', name) for name in args.passes.split(',') if name]
+
+    inputs = []
+    for pattern in args.inputs:
+        for path in sorted(glob.glob(pattern, recursive=True)) or [pattern]:
+            try:
+                inputs.append((os.path.relpath(path), None, load_program(path)))
+            except (OSError, ValueError, subprocess.CalledProcessError) as e:
+                print(f"skipping {path}: {e}", file=sys.stderr)
+    shapes = [shape for shape in args.shapes.split(',') if shape]
+    for shape in shapes:
+        for size in [int(n) for n in args.scale.split(',') if n]:
+            inputs.append((f"{shape}:{size}", shape, generate(seed=size, shape=shape, size=size)))
+
+    results = []
+    for label, shape, prog in inputs:
+        size = program_size(prog)
+        for kind, name in targets:
+            result = {'input': label, 'shape': shape, 'instrs': size, 'kind': kind, 'name': name}
+            result.update(measure(prog, kind, name, args.repeat))
+            results.append(result)
+            print(f"{label:>24} {kind:>8} {name:<22} "
+                  + (f"{result['seconds'] * 1000:9.2f} ms {result['peak_bytes'] / 1024:9.0f} KiB"
+                     if 'error' not in result else result['error']),
+                  file=sys.stderr)
+
+    scaling = []
+    for shape in shapes:
+        for kind, name in targets:
+            points = [(r['instrs'], r['seconds']) for r in results
+                      if r['shape'] == shape and r['kind'] == kind and r['name'] == name
+                      and 'seconds' in r]
+            scaling.append({'shape': shape, 'kind': kind, 'name': name,
+                            'exponent': scaling_exponent(points)})
+
+    report = {'results': results, 'scaling': scaling}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+
+    if args.max_exponent is not None:
+        too_slow = [s for s in scaling if s['exponent'] is not None and s['exponent'] > args.max_exponent]
+        for s in too_slow:
+            print(f"{s['kind']} {s['name']} scales as n^{s['exponent']:.2f} on {s['shape']}",
+                  file=sys.stderr)
+        if too_slow:
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
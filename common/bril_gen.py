@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import random
+import sys
+
+# Seeded generator of valid, terminating Bril programs, for fuzzing the
+# passes and for scaling measurements. Every variable is defined on entry,
+# loops count up to a small bound, division is only by non-zero constants
+# and memory accesses stay inside their allocation, so the output runs
+# cleanly under brili.
+#
+# Shapes:
+#   random  structured code: arithmetic, if/else, counted loops up to
+#           `depth` deep, prints, calls to later functions and (with
+#           `memory` > 0) alloc/store/load/free
+#   loops   `size` counted loops around an if/else, one after another
+#   chain   `size` basic blocks joined by unconditional jumps
+#   nest    `size` counted loops nested inside each other (trip**size
+#           iterations if actually run)
+#   switch  one value compared against `size` cases, each with its own
+#           block, all meeting at one join
+
+INT_OPS = ('add', 'sub', 'mul', 'add', 'sub')
+CMP_OPS = ('lt', 'le', 'gt', 'ge', 'eq')
+
+class Generator:
+    def __init__(self, seed, variables=6, depth=3, memory=0.0, trip=2):
+        self.rand = random.Random(seed)
+        self.variables = [f"v{i}" for i in range(max(1, variables))]
+        self.depth = depth
+        self.memory = memory
+        self.trip = trip
+        self.labels = 0
+        self.temps = 0
+
+    def label(self, base):
+        self.labels += 1
+        return f"{base}.{self.labels}"
+
+    def temp(self, base):
+        self.temps += 1
+        return f"{base}.{self.temps}"
+
+    def var(self):
+        return self.rand.choice(self.variables)
+
+    def const(self, dest, value, type='int'):
+        return {'dest': dest, 'type': type, 'op': 'const', 'value': value}
+
+    def prologue(self, args=()):
+        # Everything a later instruction might read is defined up front
+        instrs = [self.const('one', 1), self.const('trip', self.trip)]
+        for v in self.variables:
+            if v not in args:
+                instrs.append(self.const(v, self.rand.randint(-8, 8)))
+        if self.memory:
+            instrs += [self.const('size', 4),
+                       {'dest': 'mem', 'type': {'ptr': 'int'}, 'op': 'alloc', 'args': ['size']}]
+            for i in range(4):
+                instrs += self.store(i, self.var())
+        return instrs
+
+    def epilogue(self, returns=False):
+        instrs = [{'op': 'print', 'args': [self.var()]}]
+        if self.memory:
+            instrs.append({'op': 'free', 'args': ['mem']})
+        if returns:
+            instrs.append({'op': 'ret', 'args': [self.var()]})
+        return instrs
+
+    def arith(self):
+        dest, op = self.var(), self.rand.choice(INT_OPS + ('div',))
+        if op == 'div':
+            c = self.temp('c')
+            return [self.const(c, self.rand.choice((2, 3, -2))),
+                    {'dest': dest, 'type': 'int', 'op': 'div', 'args': [self.var(), c]}]
+        return [{'dest': dest, 'type': 'int', 'op': op, 'args': [self.var(), self.var()]}]
+
+    def address(self, index):
+        p, off = self.temp('p'), self.temp('off')
+        return p, [self.const(off, index),
+                   {'dest': p, 'type': {'ptr': 'int'}, 'op': 'ptradd', 'args': ['mem', off]}]
+
+    def store(self, index, value):
+        p, instrs = self.address(index)
+        return instrs + [{'op': 'store', 'args': [p, value]}]
+
+    def load(self, index, dest):
+        p, instrs = self.address(index)
+        return instrs + [{'dest': dest, 'type': 'int', 'op': 'load', 'args': [p]}]
+
+    def condition(self):
+        c = self.temp('cond')
+        return c, [{'dest': c, 'type': 'bool', 'op': self.rand.choice(CMP_OPS),
+                    'args': [self.var(), self.var()]}]
+
+    def counted_loop(self, body):
+        # for (i = 0; i < trip; i++) body
+        i, head, inner, done = self.temp('i'), self.label('head'), self.label('body'), self.label('done')
+        c = self.temp('cond')
+        return ([self.const(i, 0), {'label': head},
+                 {'dest': c, 'type': 'bool', 'op': 'lt', 'args': [i, 'trip']},
+                 {'op': 'br', 'args': [c], 'labels': [inner, done]}, {'label': inner}]
+                + body
+                + [{'dest': i, 'type': 'int', 'op': 'add', 'args': [i, 'one']},
+                   {'op': 'jmp', 'labels': [head]}, {'label': done}])
+
+    def if_else(self, then, other):
+        c, instrs = self.condition()
+        t, e, j = self.label('then'), self.label('else'), self.label('join')
+        return (instrs + [{'op': 'br', 'args': [c], 'labels': [t, e]}, {'label': t}] + then
+                + [{'op': 'jmp', 'labels': [j]}, {'label': e}] + other + [{'label': j}])
+
+    def statements(self, budget, depth, callees):
+        # Random structured code using up about `budget` blocks
+        instrs = []
+        while budget > 0:
+            k = self.rand.random()
+            if depth < self.depth and k < 0.2:
+                inner = self.rand.randint(0, budget - 1) if budget > 1 else 0
+                instrs += self.counted_loop(self.statements(inner, depth + 1, callees))
+                budget -= 3 + inner
+            elif k < 0.4:
+                inner = self.rand.randint(0, budget - 1) if budget > 1 else 0
+                half = inner // 2
+                instrs += self.if_else(self.statements(half, depth + 1, callees),
+                                       self.statements(inner - half, depth + 1, callees))
+                budget -= 3 + inner
+            else:
+                budget -= 1
+                for _ in range(self.rand.randint(1, 4)):
+                    instrs += self.straight_line(callees)
+        return instrs
+
+    def straight_line(self, callees):
+        k = self.rand.random()
+        if self.memory and k < self.memory:
+            index = self.rand.randrange(4)
+            if self.rand.random() < 0.5:
+                return self.store(index, self.var())
+            return self.load(index, self.var())
+        if callees and k > 0.95:
+            name, arity = self.rand.choice(callees)
+            return [{'dest': self.var(), 'type': 'int', 'op': 'call', 'funcs': [name],
+                     'args': [self.var() for _ in range(arity)]}]
+        if k > 0.9:
+            return [{'op': 'print', 'args': [self.var()]}]
+        return self.arith()
+
+    def function(self, name, blocks, callees, arity=0):
+        args = self.variables[:arity]
+        returns = name != 'main'
+        body = self.prologue(args) + self.statements(blocks, 0, callees) + self.epilogue(returns)
+        func = {'name': name, 'instrs': body}
+        if returns:
+            func['args'] = [{'name': a, 'type': 'int'} for a in args]
+            func['type'] = 'int'
+        return func
+
+    def random_program(self, functions, blocks):
+        # Functions only call functions defined after them, so there is no
+        # recursion and every call returns
+        funcs = []
+        callees = []
+        for k in reversed(range(functions)):
+            name = 'main' if k == 0 else f"f{k}"
+            arity = 0 if k == 0 else self.rand.randint(0, min(3, len(self.variables)))
+            funcs.append(self.function(name, blocks, list(callees), arity))
+            callees.append((name, arity))
+        funcs.reverse()
+        return {'functions': funcs}
+
+    def loops(self, size):
+        body = []
+        for _ in range(size):
+            body += self.counted_loop(self.if_else(self.arith(), self.arith()))
+        return self.program(body)
+
+    def chain(self, size):
+        body = []
+        for _ in range(size):
+            label = self.label('b')
+            body += self.arith() + [{'op': 'jmp', 'labels': [label]}, {'label': label}]
+        return self.program(body)
+
+    def nest(self, size):
+        body = self.arith()
+        for _ in range(size):
+            body = self.counted_loop(body)
+        return self.program(body)
+
+    def switch(self, size):
+        # if v0 == 0 ... elif v0 == 1 ... as a cascade of branches
+        x, join = self.var(), self.label('join')
+        body = []
+        for case in range(size):
+            k, c = self.temp('k'), self.temp('cond')
+            hit, miss = self.label('case'), self.label('next')
+            body += [self.const(k, case), {'dest': c, 'type': 'bool', 'op': 'eq', 'args': [x, k]},
+                     {'op': 'br', 'args': [c], 'labels': [hit, miss]}, {'label': hit}]
+            body += self.arith() + [{'op': 'jmp', 'labels': [join]}, {'label': miss}]
+        body += self.arith() + [{'label': join}]
+        return self.program(body)
+
+    def program(self, body):
+        return {'functions': [{'name': 'main', 'instrs': self.prologue() + body + self.epilogue()}]}
+
+SHAPES = ('random', 'loops', 'chain', 'nest', 'switch')
+
+def generate(seed=0, shape='random', size=20, functions=1, variables=6, depth=3, memory=0.0, trip=2):
+    # `size` is the per-function block budget for `random` and the number
+    # of repeated units for the other shapes
+    gen = Generator(seed, variables=variables, depth=depth, memory=memory, trip=trip)
+    if shape == 'random':
+        return gen.random_program(functions, size)
+    if shape not in SHAPES:
+        raise ValueError(f"unknown shape '{shape}' (available: {', '.join(SHAPES)})")
+    return getattr(gen, shape)(size)
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a random valid Bril program.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--shape', choices=SHAPES, default='random')
+    parser.add_argument('--size', type=int, default=20,
+                        help='blocks per function (random) or repeated units (other shapes)')
+    parser.add_argument('--functions', type=int, default=1, help='number of functions (random)')
+    parser.add_argument('--vars', type=int, default=6, help='number of integer variables')
+    parser.add_argument('--depth', type=int, default=3, help='maximum loop/branch nesting (random)')
+    parser.add_argument('--memory', type=float, default=0.0,
+                        help='fraction of straight-line instructions that are loads or stores')
+    parser.add_argument('--trip', type=int, default=2, help='iterations of every loop')
+    args = parser.parse_args()
+    prog = generate(args.seed, args.shape, args.size, args.functions, args.vars,
+                    args.depth, args.memory, args.trip)
+    json.dump(prog, sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+import json
+import os
+import re
+import sys
+from functools import partial
+
+import instrument
+from parallel import map_functions
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON in and out for the pass scripts. Output is compact unless `pretty` is
+# asked for, and goes through orjson when it is installed. Objects that are
+# not plain JSON (the compact IR in ir.py) are written via their to_json().
+
+def _to_json(obj):
+    to_json = getattr(obj, 'to_json', None)
+    if to_json is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return to_json()
+
+def loads(text):
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+def dumps(obj, pretty=False):
+    if pretty:
+        return json.dumps(obj, indent=2, default=_to_json)
+    if orjson is not None:
+        return orjson.dumps(obj, default=_to_json).decode()
+    return json.dumps(obj, separators=(',', ':'), default=_to_json)
+
+def canonical(obj):
+    # Stable bytes for hashing: sorted keys, no whitespace
+    if orjson is not None:
+        return orjson.dumps(obj, option=orjson.OPT_SORT_KEYS, default=_to_json)
+    return json.dumps(obj, sort_keys=True, separators=(',', ':'), default=_to_json).encode()
+
+def load(fp):
+    return loads(fp.read())
+
+def dump(obj, fp, pretty=False):
+    fp.write(dumps(obj, pretty))
+
+WHITESPACE = re.compile(r'\s*')
+DECODER = json.JSONDecoder()
+
+class StreamReader:
+    # Pulls JSON values off a text stream one at a time, so only the value
+    # being parsed (and one read chunk) is held in memory
+    def __init__(self, fp, chunk_size=1 << 16):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size):
+        data = self.fp.read(size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        # Next non-whitespace character, or '' at the end of the input
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self.fill(self.chunk_size):
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise json.JSONDecodeError(f"Expecting '{char}'", self.buf, self.pos)
+        self.pos += 1
+
+    def value(self):
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = DECODER.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Probably cut off by the end of the buffer. Read more,
+                # doubling each time so a big value is re-scanned only
+                # a logarithmic number of times.
+                if self.fill(size):
+                    size *= 2
+                    continue
+                raise
+            # A number running into the end of the buffer may continue
+            if end == len(self.buf) and not self.eof and self.fill(size):
+                size *= 2
+                continue
+            self.pos = end
+            return value
+
+def stream_program(fin, fout, transform, pretty=False):
+    # Rewrite a program one function at a time: each element of "functions"
+    # is parsed, passed through `transform` and written out before the next
+    # one is read. Other top-level members are copied through in order.
+    reader = StreamReader(fin)
+    reader.expect('{')
+    fout.write('{')
+    first = True
+    while reader.peek() != '}':
+        if not first:
+            reader.expect(',')
+            fout.write(',')
+        first = False
+        key = reader.value()
+        reader.expect(':')
+        fout.write(dumps(key) + ':')
+        if key != 'functions':
+            fout.write(dumps(reader.value(), pretty))
+            continue
+        reader.expect('[')
+        fout.write('[')
+        count = 0
+        while reader.peek() != ']':
+            if count:
+                reader.expect(',')
+                fout.write(',')
+            fout.write(dumps(transform(reader.value()), pretty))
+            count += 1
+        reader.expect(']')
+        fout.write(']')
+    reader.expect('}')
+    fout.write('}')
+
+def option_value(argv, name, default=None):
+    # `--name VALUE` or `--name=VALUE` from a hand-parsed argument list
+    for i, arg in enumerate(argv):
+        if arg == name and i + 1 < len(argv):
+            return argv[i + 1]
+        if arg.startswith(name + '='):
+            return arg.split('=', 1)[1]
+    return default
+
+def describe_pass(optimize_function):
+    # Names a pass and its options for cache keys; the module file tells
+    # apart same-named functions in different scripts
+    fn, options = optimize_function, {}
+    while hasattr(fn, 'func'):      # functools.partial
+        options = {**fn.keywords, **options}
+        fn = fn.func
+    path = getattr(sys.modules.get(fn.__module__), '__file__', None) or fn.__module__
+    return f"{os.path.basename(path)}:{fn.__qualname__}{sorted(options.items())}"
+
+def run_function_pass(optimize_function, argv=None):
+    # main() for scripts whose pass works on one function at a time and
+    # updates it in place. `--stream` bounds memory by the largest function,
+    # `--jobs N` spreads functions over N processes (0: one per core),
+    # `--cache DIR` reuses results of earlier runs, `--stats` reports
+    # timings and counters on stderr and `--pretty` restores indented output.
+    argv = sys.argv[1:] if argv is None else argv
+    pretty = '--pretty' in argv
+    jobs = int(option_value(argv, '--jobs', 1))
+    cache_dir = option_value(argv, '--cache')
+    description = describe_pass(optimize_function)
+    if '--stats' in argv:
+        instrument.enable()
+    if instrument.enabled:
+        name = os.path.splitext(os.path.basename(sys.argv[0]))[0]
+        optimize_function = partial(instrument.instrumented, 'pass', name, optimize_function)
+    if '--stream' in argv:
+        if jobs != 1 or cache_dir:
+            raise ValueError("--stream cannot be combined with --jobs or --cache")
+        def transform(func):
+            optimize_function(func)
+            return func
+        stream_program(sys.stdin, sys.stdout, transform, pretty)
+        return
+    prog = load(sys.stdin)
+    funcs = prog.get('functions')
+    if funcs is not None and cache_dir:
+        from cache import FunctionCache, cached_map, code_version     # cache imports this module
+        cache = FunctionCache(cache_dir)
+        pipeline = description + ':' + code_version()
+        prog['functions'] = cached_map(cache, pipeline, optimize_function, funcs, jobs)
+    elif funcs is not None:
+        prog['functions'] = map_functions(optimize_function, funcs, jobs)
+    dump(prog, sys.stdout, pretty)
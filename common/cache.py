@@ -0,0 +1,122 @@
+import hashlib
+import os
+import sys
+import tempfile
+
+import bril_json
+from parallel import map_functions
+
+# On-disk cache of optimized functions. An entry is keyed by the hash of the
+# canonical input function, the pass list and the source of every module
+# the passes are built from, so editing a pass invalidates its entries
+# without anyone bumping a version number. Entries are plain JSON files;
+# a hit refreshes the file's mtime and eviction removes the oldest ones once
+# the directory grows past its size bound.
+
+DEFAULT_MAX_BYTES = 256 << 20
+
+_source_hashes = {}
+
+def source_hash(module_name):
+    digest = _source_hashes.get(module_name)
+    if digest is None:
+        path = getattr(sys.modules.get(module_name), '__file__', None)
+        h = hashlib.sha256()
+        if path:
+            with open(path, 'rb') as f:
+                h.update(f.read())
+        digest = _source_hashes[module_name] = h.hexdigest()
+    return digest
+
+def code_version():
+    # Every loaded module that lives in this repository: the passes, their
+    # wrappers and the shared analyses they are built from
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+    modules = [name for name, module in list(sys.modules.items())
+               if os.path.abspath(getattr(module, '__file__', None) or '').startswith(root)]
+    h = hashlib.sha256()
+    for name in sorted(modules):
+        h.update(name.encode() + b'\0' + source_hash(name).encode())
+    return h.hexdigest()
+
+class FunctionCache:
+    def __init__(self, directory, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, func, pipeline):
+        # `pipeline` identifies the passes and their code version
+        h = hashlib.sha256(pipeline.encode())
+        h.update(b'\0')
+        h.update(bril_json.canonical(func))
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key[:2], key[2:] + '.json')
+
+    def get(self, key):
+        path = self.path(key)
+        try:
+            with open(path) as f:
+                func = bril_json.load(f)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        self.hits += 1
+        return func
+
+    def put(self, key, func):
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write and rename so a concurrent reader never sees half a file
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        with os.fdopen(fd, 'w') as f:
+            bril_json.dump(func, f)
+        os.replace(tmp, path)
+
+    def trim(self):
+        # Least recently used entries go first, down to 90% of the bound so
+        # the next few runs do not each trigger another scan
+        entries = []
+        total = 0
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, path))
+                total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                continue
+            total -= size
+
+def cached_map(cache, pipeline, optimize_function, funcs, jobs=1):
+    # map_functions, but functions seen before come straight from the cache
+    # and only the misses are optimized
+    keys = [cache.key(func, pipeline) for func in funcs]
+    result = [cache.get(key) for key in keys]
+    missing = [i for i, func in enumerate(result) if func is None]
+    if missing:
+        optimized = map_functions(optimize_function, [funcs[i] for i in missing], jobs)
+        for i, func in zip(missing, optimized):
+            cache.put(keys[i], func)
+            result[i] = func
+        cache.trim()
+    return result
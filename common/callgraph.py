@@ -0,0 +1,151 @@
+from cfg import CFG
+from dominators import reverse_postorder
+
+# Operations that only compute a value from their operands. The passes that
+# reuse, delete or move such computations all start from this set.
+VALUE_OPS = frozenset({
+    'const', 'id',
+    'add', 'sub', 'mul', 'div', 'eq', 'ne', 'lt', 'gt', 'le', 'ge', 'not', 'and', 'or',
+    'fadd', 'fsub', 'fmul', 'fdiv', 'feq', 'flt', 'fgt', 'fle', 'fge',
+    'ceq', 'clt', 'cgt', 'cle', 'cge', 'char2int', 'int2char', 'ptradd',
+})
+# Operations that move control around inside the function. Anything outside
+# these two sets (prints, memory, allocation, unknown extensions) makes a
+# function impure.
+CONTROL_OPS = frozenset({'nop', 'phi', 'jmp', 'br', 'ret'})
+LOCAL_OPS = VALUE_OPS | CONTROL_OPS
+
+def callee_of(instr):
+    funcs = instr.get('funcs') if instr.get('op') == 'call' else None
+    return funcs[0] if funcs else None
+
+class CallGraph:
+    # Which functions call which. Calls to functions the program does not
+    # define are kept in `callees` but lead nowhere.
+    def __init__(self, prog):
+        self.functions = {func['name']: func for func in prog.get('functions', [])}
+        self.callees = {name: [] for name in self.functions}
+        self.callers = {name: [] for name in self.functions}
+        for name, func in self.functions.items():
+            for instr in func.get('instrs', []):
+                if instr.get('op') != 'call':
+                    continue
+                for callee in instr.get('funcs', ()):
+                    if callee not in self.callees[name]:
+                        self.callees[name].append(callee)
+                        if callee in self.callers:
+                            self.callers[callee].append(name)
+        self.components = self.strongly_connected_components()
+
+    def strongly_connected_components(self):
+        # Tarjan's algorithm, iteratively. Components come out bottom-up:
+        # each one after every component it calls into.
+        index, low = {}, {}
+        stack, on_stack = [], set()
+        components = []
+        for root in self.functions:
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.callees[root]))]
+            while work:
+                name, callees = work[-1]
+                for callee in callees:
+                    if callee not in self.functions:
+                        continue
+                    if callee not in index:
+                        index[callee] = low[callee] = len(index)
+                        stack.append(callee)
+                        on_stack.add(callee)
+                        work.append((callee, iter(self.callees[callee])))
+                        break
+                    if callee in on_stack:
+                        low[name] = min(low[name], index[callee])
+                else:
+                    work.pop()
+                    if work:
+                        caller = work[-1][0]
+                        low[caller] = min(low[caller], low[name])
+                    if low[name] == index[name]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member == name:
+                                break
+                        components.append(component)
+        return components
+
+    def is_recursive(self, component):
+        return len(component) > 1 or component[0] in self.callees[component[0]]
+
+class CallEffects:
+    # What calls to each function of a program can do besides return.
+    #   pure   no prints, memory accesses or allocation, itself or in
+    #          anything it calls, so the result depends only on the
+    #          arguments and two calls with the same ones can share it.
+    #   total  pure, and also sure to return: no loops, no recursion and
+    #          nothing that can fail. A total call whose result is unused
+    #          can be deleted, and one can be run where it would not have been.
+    # Functions outside the program are neither; without a summary (the
+    # default) every call is opaque.
+    def __init__(self, pure=frozenset(), total=frozenset()):
+        self.pure = frozenset(pure)
+        self.total = frozenset(total)
+
+    def is_pure(self, instr):
+        return callee_of(instr) in self.pure
+
+    def is_total(self, instr):
+        return callee_of(instr) in self.total
+
+    def digest(self):
+        # Identifies the summary in cache keys
+        return ','.join(sorted(self.pure)) + ';' + ','.join(sorted(self.total))
+
+UNKNOWN_EFFECTS = CallEffects()
+
+def has_cycle(func):
+    # In reverse postorder only the edges that close a cycle go backwards
+    cfg = CFG(func)
+    order = {label: i for i, label in enumerate(reverse_postorder(cfg))}
+    return any(order[succ] <= order[label]
+               for label in order for succ in cfg.succs[label])
+
+def may_fail(func):
+    # Division is safe when every definition of the divisor is a non-zero
+    # constant (and it is not a parameter)
+    nonzero = {arg['name']: False for arg in func.get('args', [])}
+    for instr in func.get('instrs', []):
+        if 'dest' in instr:
+            constant = instr.get('op') == 'const' and instr.get('value') not in (0, False)
+            nonzero[instr['dest']] = nonzero.get(instr['dest'], True) and constant
+    for instr in func.get('instrs', []):
+        op = instr.get('op')
+        if op == 'int2char' or op == 'div' and not nonzero.get(instr['args'][1], False):
+            return True
+    return False
+
+def call_effects(prog, graph=None):
+    # Summaries are settled one strongly connected component at a time,
+    # callees first, so every call leaving a component has its answer
+    graph = graph or CallGraph(prog)
+    pure, total = set(), set()
+    for component in graph.components:
+        instrs = [instr for name in component for instr in graph.functions[name].get('instrs', [])]
+        outside = [callee for name in component for callee in graph.callees[name] if callee not in component]
+        if not all(instr.get('op') in LOCAL_OPS or instr.get('op') == 'call' and instr.get('funcs')
+                   for instr in instrs if 'op' in instr):
+            continue
+        if not all(callee in pure for callee in outside):
+            continue
+        pure.update(component)
+        if (not graph.is_recursive(component)
+                and all(callee in total for callee in outside)
+                and not may_fail(graph.functions[component[0]])
+                and not has_cycle(graph.functions[component[0]])):
+            total.update(component)
+    return CallEffects(pure, total)
@@ -0,0 +1,154 @@
+from ir import Instr
+
+TERMINATORS = ('jmp', 'br', 'ret')
+
+class CFG:
+    def __init__(self, func):
+        self.name = func.get('name')
+        self.blocks = {}          # label -> instructions (without the label itself), in layout order
+        self.succs = {}           # label -> successor labels
+        self.preds = {}           # label -> predecessor labels
+        self.label_instrs = {}    # label -> original label instruction
+        self.synthetic = set()    # labels made up for blocks that had none
+        self.reserved = set()     # every label that appears in the function
+        self.build(func.get('instrs', []))
+
+    @property
+    def entry(self):
+        return next(iter(self.blocks), None)
+
+    def fresh_label(self, base):
+        label = base
+        n = 0
+        while label in self.blocks or label in self.reserved:
+            n += 1
+            label = f"{base}.{n}"
+        return label
+
+    def build(self, instrs):
+        self.reserved = {instr['label'] for instr in instrs if 'label' in instr}
+        current = None
+
+        def start_block(label, label_instr=None):
+            self.blocks[label] = []
+            if label_instr is None:
+                self.synthetic.add(label)
+            else:
+                self.label_instrs[label] = label_instr
+            return label
+
+        for instr in instrs:
+            if type(instr) is Instr:
+                label, op = instr.label, instr.op
+            else:
+                label, op = instr.get('label'), instr.get('op')
+            if label is not None:
+                current = start_block(label, instr)
+                continue
+            if current is None:
+                # Unlabelled code at the start of the function or after a terminator
+                current = start_block(self.fresh_label('__entry' if not self.blocks else '__b'))
+            self.blocks[current].append(instr)
+            if op in TERMINATORS:
+                current = None
+
+        self.compute_edges()
+
+    def compute_edges(self):
+        labels = list(self.blocks)
+        self.succs = {label: [] for label in labels}
+        self.preds = {label: [] for label in labels}
+        for i, label in enumerate(labels):
+            block = self.blocks[label]
+            last = block[-1] if block else {}
+            op = last.get('op')
+            if op in ('jmp', 'br'):
+                targets = last.get('labels', [])
+            elif op == 'ret':
+                targets = []
+            else:
+                targets = [labels[i + 1]] if i + 1 < len(labels) else []
+            for target in targets:
+                if target in self.blocks and target not in self.succs[label]:
+                    self.succs[label].append(target)
+                    self.preds[target].append(label)
+
+    def add_edge(self, src, dst):
+        if dst not in self.succs[src]:
+            self.succs[src].append(dst)
+            self.preds[dst].append(src)
+
+    def remove_edge(self, src, dst):
+        if dst in self.succs[src]:
+            self.succs[src].remove(dst)
+            self.preds[dst].remove(src)
+
+    def remove_block(self, label):
+        for succ in list(self.succs[label]):
+            self.remove_edge(label, succ)
+        for pred in list(self.preds[label]):
+            self.remove_edge(pred, label)
+        del self.blocks[label], self.succs[label], self.preds[label]
+        self.synthetic.discard(label)
+        self.label_instrs.pop(label, None)
+
+    def insert_block(self, label, instrs, before):
+        self.reserved.add(label)
+        # Rebuild the dict so the new block lands in the right layout position
+        blocks = {}
+        for name, block in self.blocks.items():
+            if name == before:
+                blocks[label] = instrs
+            blocks[name] = block
+        self.blocks = blocks
+        self.succs[label] = []
+        self.preds[label] = []
+        self.synthetic.add(label)
+
+    def reachable(self):
+        seen = set()
+        stack = [self.entry] if self.entry is not None else []
+        while stack:
+            label = stack.pop()
+            if label in seen:
+                continue
+            seen.add(label)
+            stack.extend(self.succs[label])
+        return seen
+
+    def to_instrs(self):
+        labels = list(self.blocks)
+        # Edges are authoritative: a fall-through whose target is no longer
+        # the next block in layout becomes an explicit jump
+        fixups = {}
+        for i, label in enumerate(labels):
+            block = self.blocks[label]
+            if block and block[-1].get('op') in TERMINATORS:
+                continue
+            succs = self.succs[label]
+            nxt = labels[i + 1] if i + 1 < len(labels) else None
+            if succs and succs[0] != nxt:
+                fixups[label] = {'op': 'jmp', 'labels': [succs[0]]}
+            elif not succs and nxt is not None:
+                fixups[label] = {'op': 'ret'}
+
+        # Labels must be emitted for jump targets and for blocks named by phis
+        targets = set()
+        for label in labels:
+            block = self.blocks[label]
+            if block and block[-1].get('op') in ('jmp', 'br'):
+                targets.update(block[-1].get('labels', []))
+            for instr in block:
+                if instr.get('op') == 'phi':
+                    targets.update(instr.get('labels', []))
+        for instr in fixups.values():
+            targets.update(instr.get('labels', []))
+
+        instrs = []
+        for label in labels:
+            if label not in self.synthetic or label in targets:
+                instrs.append(self.label_instrs.get(label, {'label': label}))
+            instrs.extend(self.blocks[label])
+            if label in fixups:
+                instrs.append(fixups[label])
+        return instrs
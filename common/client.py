@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import socket
+import sys
+
+# Drop-in for `pipeline.py --passes ...` that hands the program to a running
+# `server.py --socket` instead of importing every pass itself. Without a
+# server it falls back to running the pipeline in this process.
+
+def default_socket_path():
+    return os.environ.get('BRIL_OPT_SOCKET', f"/tmp/bril-opt-{os.getuid()}.sock")
+
+def envelope(passes, program_text):
+    # The program is forwarded as-is; only the envelope is built here
+    return '{"passes":' + json.dumps(passes) + ',"program":' + program_text + '}\n'
+
+def request(path, passes, program_text):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall(envelope(passes, program_text).encode())
+        sock.shutdown(socket.SHUT_WR)
+        with sock.makefile('rb') as f:
+            return json.loads(f.readline())
+
+def run_locally(passes, program_text):
+    # Only pay for importing the passes when there is no server
+    from server import handle_request
+    return json.loads(handle_request(envelope(passes, program_text)))
+
+def main():
+    parser = argparse.ArgumentParser(description='Send a program to the optimizer server.')
+    parser.add_argument('--passes', required=True, help='comma-separated pass list, as for pipeline.py')
+    parser.add_argument('--socket', default=default_socket_path(), help='server socket path')
+    args = parser.parse_args()
+
+    # Newlines frame requests, so the program must sit on one line
+    program_text = json.dumps(json.load(sys.stdin), separators=(',', ':'))
+    try:
+        response = request(args.socket, args.passes, program_text)
+    except (FileNotFoundError, ConnectionRefusedError):
+        response = run_locally(args.passes, program_text)
+
+    if 'error' in response:
+        print(f"Error: {response['error']}", file=sys.stderr)
+        sys.exit(1)
+    json.dump(response['program'], sys.stdout, separators=(',', ':'))
+
+if __name__ == '__main__':
+    main()
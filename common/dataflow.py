@@ -0,0 +1,209 @@
+import heapq
+from functools import reduce
+
+import instrument
+from dominators import reverse_postorder
+from ir import Instr
+
+def iter_bits(bits):
+    # Positions of the set bits, lowest first
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+class Interner:
+    # Maps variable names (or any hashable fact) to bit positions
+    def __init__(self):
+        self.index = {}
+        self.names = []
+
+    def bit(self, name):
+        i = self.index.get(name)
+        if i is None:
+            i = self.index[name] = len(self.names)
+            self.names.append(name)
+        return 1 << i
+
+    def bits(self, names):
+        result = 0
+        for name in names:
+            result |= self.bit(name)
+        return result
+
+    def contains(self, bits, name):
+        i = self.index.get(name)
+        return i is not None and bits >> i & 1 == 1
+
+    def decode(self, bits):
+        return {self.names[i] for i in iter_bits(bits)}
+
+def solve(cfg, transfer, meet, init, boundary, forward=True):
+    # Worklist solver over blocks. `transfer(label, value)` maps the value
+    # flowing into a block to the value flowing out; `meet(values)` combines
+    # the values arriving over several edges. Blocks are visited in reverse
+    # postorder (forward) or postorder (backward) and each one is queued at
+    # most once at a time.
+    #
+    # Returns (before, after): the values at the start and at the end of each
+    # block in program order, whatever the direction of the problem.
+    order = reverse_postorder(cfg)
+    seen = set(order)
+    order += [label for label in cfg.blocks if label not in seen]
+    if not forward:
+        order.reverse()
+    priority = {label: i for i, label in enumerate(order)}
+
+    sources = cfg.preds if forward else cfg.succs
+    targets = cfg.succs if forward else cfg.preds
+    entry = cfg.entry
+
+    inputs = {label: init for label in order}
+    outputs = {label: init for label in order}
+    worklist = list(range(len(order)))
+    queued = set(order)
+    visits = 0
+    while worklist:
+        label = order[heapq.heappop(worklist)]
+        queued.discard(label)
+        visits += 1
+
+        incoming = [outputs[src] for src in sources[label]]
+        # Boundary values enter at the function entry (forward) or at
+        # blocks that leave the function (backward)
+        if (label == entry if forward else not incoming):
+            incoming.append(boundary)
+        value = meet(incoming) if incoming else boundary
+        inputs[label] = value
+
+        out = transfer(label, value)
+        if out != outputs[label]:
+            outputs[label] = out
+            for dst in targets[label]:
+                if dst not in queued:
+                    queued.add(dst)
+                    heapq.heappush(worklist, priority[dst])
+
+    instrument.count('iterations', visits)
+    if forward:
+        return inputs, outputs
+    return outputs, inputs
+
+def union(values):
+    return reduce(lambda a, b: a | b, values, 0)
+
+def solve_bitvector(cfg, gen, kill, forward=True, may=True, universe=0, boundary=0):
+    # Classic gen/kill problems on int bitsets: out = gen | (in & ~kill).
+    # `may` problems meet with union and start empty; `must` problems meet
+    # with intersection and start from `universe`.
+    def transfer(label, value):
+        return gen[label] | (value & ~kill[label])
+
+    if may:
+        return solve(cfg, transfer, union, 0, boundary, forward)
+
+    def intersection(values):
+        return reduce(lambda a, b: a & b, values, universe)
+
+    return solve(cfg, transfer, intersection, universe, boundary, forward)
+
+class Liveness:
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.interner = Interner()
+        bit = self.interner.bit
+
+        # Upward-exposed uses and definitions, once per block
+        gen = {}
+        kill = {}
+        for label, block in cfg.blocks.items():
+            g = k = 0
+            for instr in block:
+                if type(instr) is Instr:
+                    dest, args = instr.dest_name(), instr.decoded_args() or ()
+                else:
+                    dest, args = instr.get('dest'), instr.get('args', ())
+                for arg in args:
+                    b = bit(arg)
+                    if not k & b:
+                        g |= b
+                if dest is not None:
+                    k |= bit(dest)
+            gen[label] = g
+            kill[label] = k
+
+        self.live_in, self.live_out = solve_bitvector(cfg, gen, kill, forward=False)
+
+    def is_live(self, bits, name):
+        return self.interner.contains(bits, name)
+
+    def instr_live_out(self, label):
+        # Live set after each instruction of the block, as bitsets
+        bit = self.interner.bit
+        block = self.cfg.blocks[label]
+        live = self.live_out[label]
+        result = [0] * len(block)
+        for i in range(len(block) - 1, -1, -1):
+            result[i] = live
+            instr = block[i]
+            if type(instr) is Instr:
+                dest, args = instr.dest_name(), instr.decoded_args() or ()
+            else:
+                dest, args = instr.get('dest'), instr.get('args', ())
+            if dest is not None:
+                live &= ~bit(dest)
+            for arg in args:
+                live |= bit(arg)
+        return result
+
+class DefinedVariables:
+    # Variables assigned on every path from the entry: a must problem, so
+    # unreachable blocks see everything defined
+    def __init__(self, cfg, args=()):
+        self.interner = Interner()
+        gen = {}
+        for label, block in cfg.blocks.items():
+            gen[label] = self.interner.bits(instr['dest'] for instr in block if 'dest' in instr)
+        kill = {label: 0 for label in cfg.blocks}
+        boundary = self.interner.bits(args)
+        universe = (1 << len(self.interner.names)) - 1
+        self.defined_in, self.defined_out = solve_bitvector(
+            cfg, gen, kill, may=False, universe=universe, boundary=boundary)
+
+    def is_defined(self, bits, name):
+        return self.interner.contains(bits, name)
+
+class ReachingDefinitions:
+    # Every definition (function arguments included) gets its own bit
+    def __init__(self, cfg, args=()):
+        self.cfg = cfg
+        self.defs = []          # bit index -> (label, instruction index, variable)
+        self.var_defs = {}      # variable -> bitset of all its definitions
+
+        for name in args:
+            self.add_def(None, None, name)
+        for label, block in cfg.blocks.items():
+            for i, instr in enumerate(block):
+                dest = instr.dest_name() if type(instr) is Instr else instr.get('dest')
+                if dest is not None:
+                    self.add_def(label, i, dest)
+
+        gen = {label: 0 for label in cfg.blocks}
+        kill = {label: 0 for label in cfg.blocks}
+        for n, (label, _, var) in enumerate(self.defs):
+            if label is None:
+                continue
+            # Later definitions of the same variable in the block win
+            gen[label] = gen[label] & ~self.var_defs[var] | 1 << n
+            kill[label] |= self.var_defs[var] & ~(1 << n)
+
+        boundary = (1 << len(args)) - 1
+        self.reach_in, self.reach_out = solve_bitvector(cfg, gen, kill, boundary=boundary)
+
+    def add_def(self, label, index, var):
+        n = len(self.defs)
+        self.defs.append((label, index, var))
+        self.var_defs[var] = self.var_defs.get(var, 0) | 1 << n
+
+    def decode(self, bits):
+        return [self.defs[n] for n in iter_bits(bits)]
@@ -0,0 +1,156 @@
+import instrument
+
+def reverse_postorder(cfg):
+    entry = cfg.entry
+    if entry is None:
+        return []
+    order = []
+    seen = {entry}
+    stack = [(entry, iter(cfg.succs[entry]))]
+    while stack:
+        label, succs = stack[-1]
+        for succ in succs:
+            if succ not in seen:
+                seen.add(succ)
+                stack.append((succ, iter(cfg.succs[succ])))
+                break
+        else:
+            stack.pop()
+            order.append(label)
+    order.reverse()
+    return order
+
+class Dominators:
+    # Cooper, Harvey & Kennedy, "A Simple, Fast Dominance Algorithm".
+    # Only blocks reachable from the entry are covered.
+    def __init__(self, cfg):
+        self.cfg = cfg
+        self.rpo = reverse_postorder(cfg)
+        self.index = {label: i for i, label in enumerate(self.rpo)}
+        self.idom = {}
+        self.children = {label: [] for label in self.rpo}
+        self._frontiers = None
+        if not self.rpo:
+            return
+        self.compute_idoms()
+        self.number_tree()
+
+    def compute_idoms(self):
+        index = self.index
+        entry = self.rpo[0]
+        idom = {entry: entry}
+
+        def intersect(a, b):
+            while a != b:
+                while index[a] > index[b]:
+                    a = idom[a]
+                while index[b] > index[a]:
+                    b = idom[b]
+            return a
+
+        changed = True
+        rounds = 0
+        while changed:
+            changed = False
+            rounds += 1
+            for label in self.rpo[1:]:
+                new_idom = None
+                for pred in self.cfg.preds[label]:
+                    if pred not in idom:
+                        continue
+                    new_idom = pred if new_idom is None else intersect(pred, new_idom)
+                if idom.get(label) != new_idom:
+                    idom[label] = new_idom
+                    changed = True
+
+        instrument.count('iterations', rounds)
+        idom[entry] = None
+        self.idom = idom
+        for label in self.rpo[1:]:
+            self.children[idom[label]].append(label)
+
+    def number_tree(self):
+        # Pre/post numbers on the dominator tree make dominates() O(1)
+        self.pre = {}
+        self.post = {}
+        counter = 0
+        stack = [(self.rpo[0], False)]
+        while stack:
+            label, done = stack.pop()
+            if done:
+                self.post[label] = counter
+                counter += 1
+                continue
+            self.pre[label] = counter
+            counter += 1
+            stack.append((label, True))
+            for child in reversed(self.children[label]):
+                stack.append((child, False))
+
+    def __contains__(self, label):
+        return label in self.index
+
+    def dominates(self, a, b):
+        if a not in self.index or b not in self.index:
+            return False
+        return self.pre[a] <= self.pre[b] and self.post[b] <= self.post[a]
+
+    def strictly_dominates(self, a, b):
+        return a != b and self.dominates(a, b)
+
+    def dominators_of(self, label):
+        doms = []
+        while label is not None:
+            doms.append(label)
+            label = self.idom[label]
+        return doms
+
+    def preorder(self):
+        return sorted(self.pre, key=self.pre.get)
+
+    @property
+    def frontiers(self):
+        if self._frontiers is None:
+            df = {label: set() for label in self.rpo}
+            for label in self.rpo:
+                preds = [p for p in self.cfg.preds[label] if p in self.index]
+                # The entry also has an implicit edge from outside the function
+                if len(preds) < (1 if label == self.rpo[0] else 2):
+                    continue
+                for pred in preds:
+                    runner = pred
+                    while runner != self.idom[label]:
+                        df[runner].add(label)
+                        runner = self.idom[runner]
+            self._frontiers = df
+        return self._frontiers
+
+def compute_dominators(cfg):
+    return Dominators(cfg)
+
+class ReversedCFG:
+    # The CFG with its edges flipped and a virtual exit block, which every
+    # block that leaves the function flows into, as the entry
+    def __init__(self, cfg):
+        self.exit = cfg.fresh_label('__exit')
+        exits = [label for label in cfg.blocks if not cfg.succs[label]]
+        self.blocks = dict.fromkeys([self.exit, *cfg.blocks])
+        self.succs = {label: list(cfg.preds[label]) for label in cfg.blocks}
+        self.preds = {label: list(cfg.succs[label]) for label in cfg.blocks}
+        self.succs[self.exit] = exits
+        self.preds[self.exit] = []
+        for label in exits:
+            self.preds[label].append(self.exit)
+
+    @property
+    def entry(self):
+        return self.exit
+
+def compute_post_dominators(cfg):
+    # Blocks that cannot reach an exit (infinite loops) are left out, just as
+    # unreachable blocks are left out of the dominator tree. The frontiers of
+    # the result are the control dependences of the original CFG.
+    reversed_cfg = ReversedCFG(cfg)
+    pdom = Dominators(reversed_cfg)
+    pdom.exit = reversed_cfg.exit
+    return pdom
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+import argparse
+import sys
+
+import bril_json
+import instrument
+from callgraph import CallGraph, callee_of
+from cfg import CFG
+from dominators import compute_dominators
+from loops import LoopForest, find_natural_loops
+
+# A callee this small (in instructions) is always worth copying; a bigger one
+# is inlined only when it has a single call site
+DEFAULT_MAX_SIZE = 40
+# Inlining may grow the program by this fraction of its original size
+DEFAULT_GROWTH = 1.0
+
+def size(func):
+    return sum(1 for instr in func.get('instrs', []) if 'op' in instr)
+
+def as_dict(instr):
+    # A fresh JSON-style copy, from either representation
+    to_json = getattr(instr, 'to_json', None)
+    data = to_json() if to_json is not None else dict(instr)
+    for key in ('args', 'labels', 'funcs'):
+        if key in data:
+            data[key] = list(data[key])
+    return data
+
+def names_in(func):
+    names = {arg['name'] for arg in func.get('args', [])}
+    for instr in func.get('instrs', []):
+        if 'label' in instr:
+            names.add(instr['label'])
+        if 'dest' in instr:
+            names.add(instr['dest'])
+        names.update(instr.get('args', ()))
+        names.update(instr.get('labels', ()))
+    return names
+
+def loop_depths(func):
+    # Loop depth of every call instruction, by identity
+    cfg = CFG(func)
+    dom = compute_dominators(cfg)
+    forest = LoopForest(cfg, dom, find_natural_loops(cfg, dom))
+    depths = {}
+    for label, block in cfg.blocks.items():
+        loop = forest.loop_of(label)
+        for instr in block:
+            if instr.get('op') == 'call':
+                depths[id(instr)] = loop.depth if loop else 0
+    return depths
+
+class Inliner:
+    # Copies callees into their callers. Functions are visited callees first,
+    # so what gets copied already has its own calls inlined. Recursive
+    # functions are never inlined.
+    def __init__(self, prog, max_size=DEFAULT_MAX_SIZE, growth=DEFAULT_GROWTH):
+        self.prog = prog
+        self.graph = CallGraph(prog)
+        self.max_size = max_size
+        self.budget = int(sum(size(func) for func in self.graph.functions.values()) * growth)
+        self.recursive = {name for component in self.graph.components
+                          if self.graph.is_recursive(component) for name in component}
+        self.sites = self.call_sites()
+        self.inlined = set()
+
+    def call_sites(self):
+        sites = {name: 0 for name in self.graph.functions}
+        for func in self.prog.get('functions', []):
+            for instr in func.get('instrs', []):
+                callee = callee_of(instr)
+                if callee in sites:
+                    sites[callee] += 1
+        return sites
+
+    def cost(self, callee):
+        # How much inlining one call grows the program: a copy of the body
+        # (nothing, for a callee with one call site left, which moves), a
+        # copy of each parameter, and a copy and jump per ret in place of
+        # the call
+        func = self.graph.functions[callee]
+        rets = sum(1 for instr in func['instrs'] if instr.get('op') == 'ret')
+        body = 0 if self.sites[callee] == 1 else size(func)
+        return body + len(func.get('args', [])) + rets - 1
+
+    def account(self, callee):
+        # The call goes away and the calls in the callee's body come along
+        self.sites[callee] -= 1
+        for instr in self.graph.functions[callee]['instrs']:
+            if callee_of(instr) in self.sites:
+                self.sites[callee_of(instr)] += 1
+
+    def wanted(self, caller, instr):
+        callee = callee_of(instr)
+        if callee not in self.graph.functions or callee == caller or callee in self.recursive:
+            return False
+        if 'instrs' not in self.graph.functions[callee]:
+            return False
+        return self.sites[callee] == 1 or size(self.graph.functions[callee]) <= self.max_size
+
+    def run(self):
+        for component in self.graph.components:
+            for name in component:
+                self.inline_into(self.graph.functions[name])
+        # Functions whose every call was inlined are gone; main stays
+        sites = self.call_sites()
+        dead = {name for name in self.inlined if not sites[name] and name != 'main'}
+        self.prog['functions'] = [func for func in self.prog.get('functions', [])
+                                  if func['name'] not in dead]
+        instrument.count('functions_removed', len(dead))
+        return self.prog
+
+    def inline_into(self, func):
+        caller = func['name']
+        candidates = [instr for instr in func.get('instrs', []) if self.wanted(caller, instr)]
+        if not candidates:
+            return
+        # Calls in loops first, since they run most; then the cheapest
+        depths = loop_depths(func)
+        candidates.sort(key=lambda instr: (-depths.get(id(instr), 0), self.cost(instr['funcs'][0])))
+        chosen = set()
+        for instr in candidates:
+            # Copies made so far may have given a single-use callee more calls
+            if not self.wanted(caller, instr):
+                continue
+            cost = self.cost(instr['funcs'][0])
+            if cost <= self.budget:
+                self.budget -= cost
+                self.account(instr['funcs'][0])
+                chosen.add(id(instr))
+        if not chosen:
+            return
+
+        taken = names_in(func)
+        instrs = []
+        renamed_blocks = {}
+        block = None
+        for instr in func['instrs']:
+            if 'label' in instr:
+                block = instr['label']
+            if id(instr) not in chosen:
+                instrs.append(instr)
+                continue
+            callee = instr['funcs'][0]
+            body, resume = self.copy_body(instr, self.graph.functions[callee], taken)
+            instrs += body
+            # Code after the call now ends the block named `resume`; after
+            # several calls in one block, the last of them
+            if block is not None:
+                renamed_blocks[block] = resume
+            self.inlined.add(callee)
+            instrument.count('inlined')
+
+        # Phis naming the block that held a call now name its last piece
+        if renamed_blocks:
+            for instr in instrs:
+                if instr.get('op') == 'phi' and any(label in renamed_blocks for label in instr['labels']):
+                    instr['labels'] = [renamed_blocks.get(label, label) for label in instr['labels']]
+        func['instrs'] = instrs
+
+    def copy_body(self, call, callee, taken):
+        # The callee's code with every variable and label renamed under a
+        # prefix the caller does not use. Parameters the callee never assigns
+        # are replaced by the arguments, the rest become copies of them; each
+        # ret becomes a copy into the call's destination and a jump to the
+        # code after the call (unless it is the last instruction anyway).
+        names = names_in(callee)
+        n = 0
+        while True:
+            prefix = f"{callee['name']}.{n}."
+            if not any(prefix + name in taken for name in names):
+                break
+            n += 1
+        taken.update(prefix + name for name in names)
+        suffix = 'ret'
+        while suffix in names:
+            suffix += '_'
+        resume = prefix + suffix
+        taken.add(resume)
+
+        assigned = {instr['dest'] for instr in callee['instrs'] if 'dest' in instr}
+        rename = {name: prefix + name for name in names}
+        body = []
+        for param, arg in zip(callee.get('args', []), call.get('args', [])):
+            if param['name'] in assigned:
+                body.append({'dest': rename[param['name']], 'type': param['type'], 'op': 'id', 'args': [arg]})
+            else:
+                rename[param['name']] = arg
+        last = len(callee['instrs']) - 1
+        for i, instr in enumerate(callee['instrs']):
+            instr = as_dict(instr)
+            if 'label' in instr:
+                instr['label'] = prefix + instr['label']
+            if 'dest' in instr:
+                instr['dest'] = rename[instr['dest']]
+            if 'args' in instr:
+                instr['args'] = [rename[arg] for arg in instr['args']]
+            if 'labels' in instr:
+                instr['labels'] = [prefix + label for label in instr['labels']]
+            if instr.get('op') == 'ret':
+                if 'dest' in call and instr.get('args'):
+                    body.append({'dest': call['dest'], 'type': call['type'], 'op': 'id',
+                                 'args': instr['args']})
+                if i != last:
+                    body.append({'op': 'jmp', 'labels': [resume]})
+                continue
+            body.append(instr)
+        body.append({'label': resume})
+        return body, resume
+
+def inline_program(prog, max_size=DEFAULT_MAX_SIZE, growth=DEFAULT_GROWTH):
+    return Inliner(prog, max_size, growth).run()
+
+def main():
+    parser = argparse.ArgumentParser(description='Inline small and single-use functions.')
+    parser.add_argument('--max-size', type=int, default=DEFAULT_MAX_SIZE,
+                        help='inline callees of up to this many instructions at every call site')
+    parser.add_argument('--growth', type=float, default=DEFAULT_GROWTH,
+                        help='let the program grow by at most this fraction of its size')
+    parser.add_argument('--pretty', action='store_true', help='indent the JSON output')
+    args = parser.parse_args()
+    # Needs every function at once, so there is no --stream mode
+    prog = bril_json.load(sys.stdin)
+    inline_program(prog, args.max_size, args.growth)
+    bril_json.dump(prog, sys.stdout, args.pretty)
+
+if __name__ == '__main__':
+    main()
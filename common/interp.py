@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import math
+import sys
+
+from cfg import CFG
+from dominators import compute_dominators
+from loops import find_natural_loops
+
+# Reference interpreter for core Bril plus the memory, float and char
+# extensions, running in the same process as the passes. Each block is
+# compiled once into a list of closures; running it also records how often
+# every function, block, CFG edge and natural loop executes, which is
+# written out as a profile for passes to read back.
+
+class BrilError(Exception):
+    pass
+
+INT_MIN = -2 ** 63
+
+def wrap(value):
+    return (value - INT_MIN) % 2 ** 64 + INT_MIN
+
+def int_div(a, b):
+    if b == 0:
+        raise BrilError('division by zero')
+    quotient = abs(a) // abs(b)
+    return wrap(quotient if (a < 0) == (b < 0) else -quotient)
+
+def float_div(a, b):
+    if b == 0:
+        if a == 0 or a != a:
+            return math.nan
+        return math.copysign(math.inf, a) * math.copysign(1.0, b)
+    return a / b
+
+BINARY = {
+    'add': lambda a, b: wrap(a + b),
+    'sub': lambda a, b: wrap(a - b),
+    'mul': lambda a, b: wrap(a * b),
+    'div': int_div,
+    'eq': lambda a, b: a == b,
+    'ne': lambda a, b: a != b,
+    'lt': lambda a, b: a < b,
+    'gt': lambda a, b: a > b,
+    'le': lambda a, b: a <= b,
+    'ge': lambda a, b: a >= b,
+    'and': lambda a, b: a and b,
+    'or': lambda a, b: a or b,
+    'fadd': lambda a, b: a + b,
+    'fsub': lambda a, b: a - b,
+    'fmul': lambda a, b: a * b,
+    'fdiv': float_div,
+    'feq': lambda a, b: a == b,
+    'flt': lambda a, b: a < b,
+    'fgt': lambda a, b: a > b,
+    'fle': lambda a, b: a <= b,
+    'fge': lambda a, b: a >= b,
+    'ceq': lambda a, b: a == b,
+    'clt': lambda a, b: a < b,
+    'cgt': lambda a, b: a > b,
+    'cle': lambda a, b: a <= b,
+    'cge': lambda a, b: a >= b,
+}
+
+UNARY = {
+    'id': lambda a: a,
+    'not': lambda a: not a,
+    'char2int': ord,
+    'int2char': chr,
+}
+
+def format_value(value):
+    # Matches brili's output
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, float):
+        if value != value:
+            return 'NaN'
+        if math.isinf(value):
+            return 'Infinity' if value > 0 else '-Infinity'
+        return f"{value:.17f}"
+    if isinstance(value, Pointer):
+        return f"ptr<{value.base}:{value.offset}>"
+    return str(value)
+
+def parse_arg(text, type):
+    if type == 'bool':
+        return text == 'true'
+    if type == 'float':
+        return float(text)
+    if type == 'char':
+        return text
+    return int(text)
+
+class Pointer:
+    __slots__ = ('base', 'offset')
+
+    def __init__(self, base, offset):
+        self.base = base
+        self.offset = offset
+
+class Heap:
+    def __init__(self):
+        self.storage = {}
+        self.next_base = 0
+
+    def alloc(self, size):
+        if size <= 0:
+            raise BrilError(f"cannot allocate {size} entries")
+        self.next_base += 1
+        self.storage[self.next_base] = [None] * size
+        return Pointer(self.next_base, 0)
+
+    def free(self, ptr):
+        if ptr.offset != 0 or ptr.base not in self.storage:
+            raise BrilError('freeing a pointer that was not returned by alloc')
+        del self.storage[ptr.base]
+
+    def cells(self, ptr):
+        cells = self.storage.get(ptr.base)
+        if cells is None:
+            raise BrilError('access to freed memory')
+        if not 0 <= ptr.offset < len(cells):
+            raise BrilError('out-of-bounds memory access')
+        return cells
+
+    def load(self, ptr):
+        value = self.cells(ptr)[ptr.offset]
+        if value is None:
+            raise BrilError('load of uninitialized memory')
+        return value
+
+    def store(self, ptr, value):
+        self.cells(ptr)[ptr.offset] = value
+
+class FunctionProfile:
+    def __init__(self, cfg):
+        self.calls = 0
+        self.block_counts = dict.fromkeys(cfg.blocks, 0)
+        self.edge_counts = {}
+
+class CompiledFunction:
+    def __init__(self, interp, func):
+        self.name = func['name']
+        self.params = [arg['name'] for arg in func.get('args', [])]
+        self.types = [arg.get('type') for arg in func.get('args', [])]
+        self.cfg = CFG(func)
+        self.entry = self.cfg.entry
+        # label -> (phis, code, terminator, static instruction count)
+        self.blocks = {label: interp.compile_block(self.cfg, label) for label in self.cfg.blocks}
+
+class Interpreter:
+    def __init__(self, prog):
+        self.heap = Heap()
+        self.out = []
+        self.functions = {}
+        self.profiles = {}
+        for func in prog.get('functions', []):
+            compiled = CompiledFunction(self, func)
+            self.functions[compiled.name] = compiled
+            self.profiles[compiled.name] = FunctionProfile(compiled.cfg)
+
+    def compile_block(self, cfg, label):
+        block = cfg.blocks[label]
+        phis = [(instr['dest'], list(zip(instr.get('labels', []), instr.get('args', []))))
+                for instr in block if instr.get('op') == 'phi']
+        code = [self.compile_instr(instr) for instr in block
+                if instr.get('op') not in ('phi', 'jmp', 'br', 'ret')]
+        last = block[-1] if block else {}
+        op = last.get('op')
+        if op == 'jmp':
+            terminator = ('jmp', last['labels'][0])
+        elif op == 'br':
+            terminator = ('br', last['args'][0], last['labels'][0], last['labels'][1])
+        elif op == 'ret':
+            terminator = ('ret', last['args'][0] if last.get('args') else None)
+        else:
+            succs = cfg.succs[label]
+            terminator = ('jmp', succs[0]) if succs else ('ret', None)
+        return phis, code, terminator, len(block)
+
+    def compile_instr(self, instr):
+        op = instr.get('op')
+        dest = instr.get('dest')
+        args = instr.get('args', [])
+
+        if op == 'const':
+            value = instr['value']
+            if instr.get('type') == 'float':
+                value = float(value)
+            def run(env):
+                env[dest] = value
+        elif op in BINARY:
+            fn, (a, b) = BINARY[op], args
+            def run(env):
+                env[dest] = fn(env[a], env[b])
+        elif op in UNARY:
+            fn, (a,) = UNARY[op], args
+            def run(env):
+                env[dest] = fn(env[a])
+        elif op == 'print':
+            out = self.out
+            def run(env):
+                out.append(' '.join(format_value(env[a]) for a in args))
+        elif op == 'call':
+            callee = instr['funcs'][0]
+            def run(env):
+                result = self.call(callee, [env[a] for a in args])
+                if dest is not None:
+                    env[dest] = result
+        elif op == 'nop':
+            def run(env):
+                pass
+        elif op == 'alloc':
+            heap, (a,) = self.heap, args
+            def run(env):
+                env[dest] = heap.alloc(env[a])
+        elif op == 'free':
+            heap, (a,) = self.heap, args
+            def run(env):
+                heap.free(env[a])
+        elif op == 'store':
+            heap, (a, b) = self.heap, args
+            def run(env):
+                heap.store(env[a], env[b])
+        elif op == 'load':
+            heap, (a,) = self.heap, args
+            def run(env):
+                env[dest] = heap.load(env[a])
+        elif op == 'ptradd':
+            a, b = args
+            def run(env):
+                ptr = env[a]
+                env[dest] = Pointer(ptr.base, ptr.offset + env[b])
+        else:
+            def run(env):
+                raise BrilError(f"unsupported operation '{op}'")
+        return run
+
+    def call(self, name, values):
+        func = self.functions.get(name)
+        if func is None:
+            raise BrilError(f"undefined function '{name}'")
+        if len(values) != len(func.params):
+            raise BrilError(f"{name} expects {len(func.params)} arguments, got {len(values)}")
+        profile = self.profiles[name]
+        profile.calls += 1
+        block_counts = profile.block_counts
+        edge_counts = profile.edge_counts
+        blocks = func.blocks
+
+        env = dict(zip(func.params, values))
+        label, prev = func.entry, None
+        if label is None:
+            return None
+        try:
+            while True:
+                block_counts[label] += 1
+                if prev is not None:
+                    edge = (prev, label)
+                    edge_counts[edge] = edge_counts.get(edge, 0) + 1
+                phis, code, terminator, _ = blocks[label]
+                if phis:
+                    # All phis of a block read their inputs before any is written
+                    chosen = []
+                    for dest, incoming in phis:
+                        for pred, arg in incoming:
+                            if pred == prev and arg in env:
+                                chosen.append((dest, env[arg]))
+                                break
+                        else:
+                            chosen.append((dest, None))
+                    for dest, value in chosen:
+                        if value is None:
+                            env.pop(dest, None)
+                        else:
+                            env[dest] = value
+                for run in code:
+                    run(env)
+                kind = terminator[0]
+                if kind == 'jmp':
+                    label, prev = terminator[1], label
+                elif kind == 'br':
+                    label, prev = terminator[2] if env[terminator[1]] else terminator[3], label
+                else:
+                    return None if terminator[1] is None else env[terminator[1]]
+                if label not in blocks:
+                    raise BrilError(f"jump to unknown label '{label}' in {name}")
+        except KeyError as e:
+            raise BrilError(f"undefined variable {e} in {name}") from None
+
+    def run(self, args=()):
+        main = self.functions.get('main')
+        if main is None:
+            raise BrilError('no main function')
+        values = [parse_arg(arg, t) if isinstance(arg, str) else arg
+                  for arg, t in zip(args, main.types)]
+        self.call('main', values)
+        if self.heap.storage:
+            raise BrilError(f"{len(self.heap.storage)} allocation(s) never freed")
+        return self.out
+
+    def profile(self):
+        # Counts per function, block, edge and natural loop, as JSON-able data
+        total = 0
+        functions = {}
+        for name, func in self.functions.items():
+            prof = self.profiles[name]
+            blocks = {}
+            dyn = 0
+            for label, count in prof.block_counts.items():
+                block_dyn = count * func.blocks[label][3]
+                blocks[label] = {'count': count, 'dyn_inst': block_dyn}
+                dyn += block_dyn
+            total += dyn
+            functions[name] = {
+                'calls': prof.calls,
+                'dyn_inst': dyn,
+                'blocks': blocks,
+                'edges': [[src, dst, n] for (src, dst), n in prof.edge_counts.items()],
+                'loops': loop_profiles(func.cfg, prof, blocks),
+            }
+        return {'total_dyn_inst': total, 'functions': functions}
+
+def loop_profiles(cfg, prof, blocks):
+    # Back edges sharing a header form one loop
+    dom = compute_dominators(cfg)
+    bodies = {}
+    for header, body, _ in find_natural_loops(cfg, dom):
+        bodies.setdefault(header, set()).update(body)
+    loops = []
+    for header, body in bodies.items():
+        entries = sum(n for (src, dst), n in prof.edge_counts.items() if dst == header and src not in body)
+        if header == cfg.entry:
+            entries += prof.calls
+        loops.append({
+            'header': header,
+            'blocks': [label for label in cfg.blocks if label in body],
+            'entries': entries,
+            'iterations': prof.block_counts[header],
+            'dyn_inst': sum(blocks[label]['dyn_inst'] for label in body),
+        })
+    return loops
+
+def run_program(prog, args=()):
+    # Returns (output lines, profile)
+    interp = Interpreter(prog)
+    out = interp.run(args)
+    return out, interp.profile()
+
+def save_profile(profile, path):
+    with open(path, 'w') as f:
+        json.dump(profile, f, indent=2)
+
+def load_profile(path):
+    with open(path) as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description='Interpret a Bril program and profile it.')
+    parser.add_argument('args', nargs='*', help='arguments for main')
+    parser.add_argument('-p', action='store_true', help='print total_dyn_inst to stderr, as brili -p does')
+    parser.add_argument('--profile', metavar='FILE', help='save the execution profile as JSON')
+    args = parser.parse_args()
+
+    interp = Interpreter(json.load(sys.stdin))
+    try:
+        interp.run(args.args)
+    except BrilError as e:
+        sys.stdout.write(''.join(line + '\n' for line in interp.out))
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(2)
+    sys.stdout.write(''.join(line + '\n' for line in interp.out))
+    profile = interp.profile()
+    if args.p:
+        print(f"total_dyn_inst: {profile['total_dyn_inst']}", file=sys.stderr)
+    if args.profile:
+        save_profile(profile, args.profile)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+import json
+import sys
+
+# Compact in-memory form of a Bril program. Instructions and functions are
+# __slots__ objects instead of dicts, opcodes and labels are interned strings,
+# variables are small integer IDs into a per-function name table, and operand
+# lists are tuples of those IDs. Both classes also answer the dict protocol
+# the passes use (instr['op'], instr.get('args', []), 'dest' in instr,
+# instr['args'] = [...]), so every pass runs on either representation; the
+# hot readers (CFG construction, liveness, reaching definitions, points-to,
+# value numbering) check for an Instr and read its slots directly.
+# Decoded operand lists are cached on the instruction: assign a new list to
+# change an instruction's args rather than mutating the one you got back.
+
+class _Missing:
+    # Sentinel for absent keys; pickles by reference so it survives the
+    # trip to a worker process and back
+    __slots__ = ()
+
+    def __reduce__(self):
+        return 'MISSING'
+
+    def __repr__(self):
+        return 'MISSING'
+
+MISSING = _Missing()
+
+class Names:
+    __slots__ = ('index', 'names')
+
+    def __init__(self):
+        self.index = {}
+        self.names = []
+
+    def id(self, name):
+        i = self.index.get(name)
+        if i is None:
+            name = sys.intern(name)
+            i = self.index[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def ids(self, names):
+        return tuple(self.id(name) for name in names)
+
+    def decode(self, ids):
+        names = self.names
+        return [names[i] for i in ids]
+
+class Instr:
+    __slots__ = ('names', 'label', 'op', 'dest', 'type', 'args', 'funcs', 'labels', 'value', 'extra',
+                 'arg_names')
+
+    def __init__(self, names):
+        self.names = names
+        self.label = None
+        self.op = None
+        self.dest = None        # variable ID
+        self.type = None
+        self.args = None        # tuple of variable IDs
+        self.funcs = None
+        self.labels = None
+        self.value = MISSING
+        self.extra = None       # any keys this class does not know about
+        self.arg_names = None   # args decoded, once something asked for them
+
+    def decoded_args(self):
+        names = self.arg_names
+        if names is None and self.args is not None:
+            names = self.arg_names = self.names.decode(self.args)
+        return names
+
+    def dest_name(self):
+        return None if self.dest is None else self.names.names[self.dest]
+
+    def get(self, key, default=None):
+        # The keys passes ask for most skip the GETTERS dispatch
+        if key == 'op':
+            value = self.op
+        elif key == 'args':
+            value = self.decoded_args()
+        elif key == 'dest':
+            value = self.dest_name()
+        elif key == 'type':
+            value = self.type
+        elif key == 'label':
+            value = self.label
+        else:
+            value = MISSING
+        if value is not MISSING:
+            return default if value is None else value
+        getter = GETTERS.get(key)
+        if getter is None:
+            return self.extra.get(key, default) if self.extra else default
+        value = getter(self)
+        return default if value is MISSING else value
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __setitem__(self, key, value):
+        setter = SETTERS.get(key)
+        if setter is None:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+        else:
+            setter(self, value)
+
+    def __repr__(self):
+        return f"Instr({self.to_json()!r})"
+
+    def to_json(self):
+        out = {}
+        for key in KEYS:
+            value = GETTERS[key](self)
+            if value is not MISSING:
+                out[key] = value
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+def _optional(value):
+    return MISSING if value is None else value
+
+GETTERS = {
+    'label': lambda i: _optional(i.label),
+    'dest': lambda i: MISSING if i.dest is None else i.names.names[i.dest],
+    'type': lambda i: _optional(i.type),
+    'op': lambda i: _optional(i.op),
+    'args': lambda i: MISSING if i.args is None else list(i.decoded_args()),
+    'funcs': lambda i: MISSING if i.funcs is None else list(i.funcs),
+    'labels': lambda i: MISSING if i.labels is None else list(i.labels),
+    'value': lambda i: i.value,
+}
+
+KEYS = tuple(GETTERS)
+
+def _set(attr, convert):
+    def setter(instr, value):
+        setattr(instr, attr, convert(instr, value))
+    return setter
+
+def _set_args(instr, value):
+    instr.args = instr.names.ids(value)
+    instr.arg_names = None
+
+SETTERS = {
+    'label': _set('label', lambda i, v: sys.intern(v)),
+    'dest': _set('dest', lambda i, v: i.names.id(v)),
+    'type': _set('type', lambda i, v: v),
+    'op': _set('op', lambda i, v: sys.intern(v)),
+    'args': _set_args,
+    'funcs': _set('funcs', lambda i, v: tuple(sys.intern(f) for f in v)),
+    'labels': _set('labels', lambda i, v: tuple(sys.intern(l) for l in v)),
+    'value': _set('value', lambda i, v: v),
+}
+
+class Function:
+    __slots__ = ('names', 'name', 'args', 'type', 'instrs', 'extra')
+
+    def __init__(self, name, names=None):
+        self.names = names or Names()
+        self.name = name
+        self.args = None
+        self.type = None
+        self.instrs = []
+        self.extra = None
+
+    def get(self, key, default=None):
+        if key in FUNCTION_KEYS:
+            value = getattr(self, key)
+            return default if value is None else value
+        return self.extra.get(key, default) if self.extra else default
+
+    def __getitem__(self, key):
+        value = self.get(key, MISSING)
+        if value is MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def __setitem__(self, key, value):
+        if key in FUNCTION_KEYS:
+            setattr(self, key, value)
+        else:
+            if self.extra is None:
+                self.extra = {}
+            self.extra[key] = value
+
+    def to_json(self):
+        out = {'name': self.name}
+        if self.args is not None:
+            out['args'] = self.args
+        if self.type is not None:
+            out['type'] = self.type
+        out['instrs'] = [instr.to_json() if isinstance(instr, Instr) else instr
+                         for instr in self.instrs]
+        if self.extra:
+            out.update(self.extra)
+        return out
+
+FUNCTION_KEYS = ('name', 'args', 'type', 'instrs')
+
+def intern_type(types, t):
+    # Types are tiny and repeated on every instruction; share one object each
+    if isinstance(t, str):
+        return sys.intern(t)
+    key = json.dumps(t, sort_keys=True)
+    return types.setdefault(key, t)
+
+def instr_from_json(data, names, types):
+    instr = Instr(names)
+    for key, value in data.items():
+        if key == 'type':
+            instr.type = intern_type(types, value)
+        else:
+            instr[key] = value
+    return instr
+
+def function_from_json(data, types=None):
+    types = {} if types is None else types
+    func = Function(sys.intern(data['name']))
+    for key, value in data.items():
+        if key == 'instrs':
+            func.instrs = [instr_from_json(instr, func.names, types) for instr in value]
+        elif key != 'name':
+            func[key] = value
+    return func
+
+def program_from_json(prog):
+    types = {}
+    out = dict(prog)
+    out['functions'] = [function_from_json(func, types) for func in prog.get('functions', [])]
+    return out
+
+def program_to_json(prog):
+    out = dict(prog)
+    out['functions'] = [func.to_json() if isinstance(func, Function) else func
+                        for func in prog.get('functions', [])]
+    return out
@@ -0,0 +1,178 @@
+def loop_body(cfg, header, latch):
+    body = {header, latch}
+    stack = [latch]
+    while stack:
+        node = stack.pop()
+        if node == header:
+            continue
+        for pred in cfg.preds[node]:
+            if pred not in body:
+                body.add(pred)
+                stack.append(pred)
+    return body
+
+def find_natural_loops(cfg, dom):
+    # One (header, body, latch) entry per back edge latch -> header
+    loops = []
+    for header in cfg.blocks:
+        if header not in dom:
+            continue
+        for latch in cfg.preds[header]:
+            if dom.dominates(header, latch):
+                loops.append((header, loop_body(cfg, header, latch), latch))
+    return loops
+
+def cyclic_blocks(cfg):
+    # Blocks some path leads from back to themselves, natural loop or not:
+    # the members of each strongly connected component with more than one
+    # block, plus blocks that jump to themselves. One iterative Tarjan pass.
+    index = {}
+    low = {}
+    stack = []
+    on_stack = set()
+    cyclic = set()
+    for root in cfg.blocks:
+        if root in index:
+            continue
+        index[root] = low[root] = len(index)
+        stack.append(root)
+        on_stack.add(root)
+        work = [(root, iter(cfg.succs[root]))]
+        while work:
+            label, succs = work[-1]
+            for succ in succs:
+                if succ == label:
+                    cyclic.add(label)
+                if succ not in index:
+                    index[succ] = low[succ] = len(index)
+                    stack.append(succ)
+                    on_stack.add(succ)
+                    work.append((succ, iter(cfg.succs[succ])))
+                    break
+                if succ in on_stack:
+                    low[label] = min(low[label], index[succ])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[label])
+                if low[label] == index[label]:
+                    component = []
+                    while True:
+                        node = stack.pop()
+                        on_stack.discard(node)
+                        component.append(node)
+                        if node == label:
+                            break
+                    if len(component) > 1:
+                        cyclic.update(component)
+    return cyclic
+
+class Loop:
+    # One natural loop, with every back edge to its header merged in
+    def __init__(self, header, blocks):
+        self.header = header
+        self.blocks = blocks        # set of labels, header and nested loops included
+        self.labels = []            # the same labels in layout order
+        self.parent = None
+        self.children = []
+        self.depth = 1              # outermost loops are at depth 1
+        self.latches = []           # blocks in the loop that jump back to the header
+        self.exits = []             # (block in the loop, successor outside it) edges
+        self.exit_blocks = []       # those successors, each once
+        self.preheader = None       # sole outside predecessor, if it leads only here
+        self.defs = {}              # variable -> number of assignments in the loop
+        self.uses = set()           # variables read in the loop
+
+    def __contains__(self, label):
+        return label in self.blocks
+
+class LoopForest:
+    # Natural loops arranged by nesting. A loop's parent is found by walking
+    # up the dominator tree from its header to the nearest header whose loop
+    # contains it. Def and use summaries are built bottom-up, so every block
+    # is scanned once, by its innermost loop.
+    def __init__(self, cfg, dom, natural_loops):
+        self.cfg = cfg
+        self.loops = {}             # header -> Loop, in layout order
+        self.roots = []
+        self.innermost = {}         # label -> innermost Loop containing it
+
+        bodies = {}
+        for header, body, _ in natural_loops:
+            bodies.setdefault(header, set()).update(body)
+        for header in cfg.blocks:
+            if header in bodies:
+                self.loops[header] = Loop(header, bodies[header])
+
+        for loop in self.loops.values():
+            ancestor = dom.idom.get(loop.header)
+            while ancestor is not None:
+                outer = self.loops.get(ancestor)
+                if outer is not None and loop.header in outer.blocks:
+                    loop.parent = outer
+                    break
+                ancestor = dom.idom.get(ancestor)
+            if loop.parent is None:
+                self.roots.append(loop)
+            else:
+                loop.parent.children.append(loop)
+
+        for loop in self.preorder():
+            if loop.parent is not None:
+                loop.depth = loop.parent.depth + 1
+            for label in loop.blocks:
+                self.innermost[label] = loop
+
+        layout = {label: i for i, label in enumerate(cfg.blocks)}
+        for loop in self.postorder():
+            loop.labels = sorted(loop.blocks, key=layout.get)
+            self.summarize(loop)
+
+    def summarize(self, loop):
+        cfg = self.cfg
+        labels = loop.labels
+        header = loop.header
+        loop.latches = [pred for pred in cfg.preds[header] if pred in loop.blocks]
+        outside = [pred for pred in cfg.preds[header] if pred not in loop.blocks]
+        if len(outside) == 1 and cfg.succs[outside[0]] == [header]:
+            loop.preheader = outside[0]
+        for label in labels:
+            for succ in cfg.succs[label]:
+                if succ not in loop.blocks:
+                    loop.exits.append((label, succ))
+                    if succ not in loop.exit_blocks:
+                        loop.exit_blocks.append(succ)
+
+        defs = loop.defs
+        for child in loop.children:
+            for var, n in child.defs.items():
+                defs[var] = defs.get(var, 0) + n
+            loop.uses |= child.uses
+        for label in labels:
+            if self.innermost[label] is not loop:
+                continue
+            for instr in cfg.blocks[label]:
+                if 'dest' in instr:
+                    defs[instr['dest']] = defs.get(instr['dest'], 0) + 1
+                loop.uses.update(instr.get('args', ()))
+
+    def preorder(self):
+        stack = list(reversed(self.roots))
+        while stack:
+            loop = stack.pop()
+            yield loop
+            stack.extend(reversed(loop.children))
+
+    def postorder(self):
+        # Every loop after the loops nested in it
+        return reversed(list(self.preorder()))
+
+    def __iter__(self):
+        return iter(self.loops.values())
+
+    def __len__(self):
+        return len(self.loops)
+
+    def loop_of(self, label):
+        return self.innermost.get(label)
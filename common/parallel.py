@@ -0,0 +1,26 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+# Intraprocedural passes treat functions independently, so a program's
+# functions can be farmed out to worker processes. `optimize_function` must
+# be picklable (a module-level function or a functools.partial of one) and
+# updates its argument in place; the updated copies come back in order.
+
+def _optimize(optimize_function, func):
+    optimize_function(func)
+    return func
+
+def resolve_jobs(jobs):
+    # 0 means one worker per core
+    return jobs if jobs > 0 else os.cpu_count() or 1
+
+def map_functions(optimize_function, funcs, jobs):
+    jobs = resolve_jobs(jobs)
+    if jobs == 1 or len(funcs) < 2:
+        return [_optimize(optimize_function, func) for func in funcs]
+    # A few chunks per worker keeps the pickling overhead down without
+    # leaving cores idle behind one slow chunk
+    chunksize = max(1, len(funcs) // (jobs * 4))
+    with ProcessPoolExecutor(max_workers=min(jobs, len(funcs))) as pool:
+        return list(pool.map(partial(_optimize, optimize_function), funcs, chunksize=chunksize))
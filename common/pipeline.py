@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+from functools import partial
+
+# Make the per-task pass modules importable without copying them around
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for task in ('task1', 'task2', 'task3'):
+    sys.path.insert(0, os.path.join(ROOT, task))
+
+import bril_json
+import cache
+import constant_propagation
+import instrument
+import inline
+import licm
+import liveness_dce
+import local_dce
+import local_value_numbering
+import strength_reduction
+import tail_recursion
+from analysis import AnalysisManager
+from callgraph import call_effects
+from global_dce import global_dce
+from ir import function_from_json, program_from_json, program_to_json
+from parallel import map_functions
+from ssa import from_ssa, to_ssa
+
+def run_constprop(func, am):
+    func['instrs'] = constant_propagation.conditional_constant_propagation(func, am)
+
+# Each pass is either whole-program ('program') or per-function ('function'),
+# and lists the analyses it leaves valid. Function passes get the function's
+# AnalysisManager so the CFG, dominators and loops are built once and shared,
+# along with the call-effect summaries of the whole program. Passes never add
+# effects, so the summaries stay sound until a program pass runs.
+PASSES = {
+    'global_dce': ('program', global_dce, ()),
+    'inline': ('program', inline.inline_program, ()),
+    'lvn': ('function', local_value_numbering.local_value_numbering_function,
+            local_value_numbering.PRESERVES),
+    'gvn': ('function', local_value_numbering.global_value_numbering_function,
+            local_value_numbering.PRESERVES),
+    'local_dce': ('function', local_dce.local_value_numbering_function, local_dce.PRESERVES),
+    'constprop': ('function', run_constprop, constant_propagation.PRESERVES),
+    'liveness_dce': ('function', liveness_dce.optimize_function, liveness_dce.PRESERVES),
+    'adce': ('function', liveness_dce.aggressive_dce, liveness_dce.AGGRESSIVE_PRESERVES),
+    'memory_dce': ('function', liveness_dce.memory_dce, liveness_dce.MEMORY_PRESERVES),
+    'licm': ('function', licm.process_function, licm.PRESERVES),
+    'strength_reduction': ('function', strength_reduction.strength_reduce, strength_reduction.PRESERVES),
+    'tail_recursion': ('function', tail_recursion.process_function, tail_recursion.PRESERVES),
+    'to_ssa': ('function', to_ssa, ()),
+    'from_ssa': ('function', from_ssa, ()),
+}
+
+ALIASES = {
+    'local_value_numbering': 'lvn',
+    'global_value_numbering': 'gvn',
+    'constant_propagation': 'constprop',
+    'sccp': 'constprop',
+    'sr': 'strength_reduction',
+    'tre': 'tail_recursion',
+    'dse': 'memory_dce',
+}
+
+def parse_passes(spec):
+    passes = []
+    for name in spec.split(','):
+        name = name.strip()
+        if not name:
+            continue
+        name = ALIASES.get(name, name)
+        if name not in PASSES:
+            raise ValueError(f"unknown pass '{name}' (available: {', '.join(sorted(PASSES))})")
+        passes.append(name)
+    return passes
+
+def instruction_count(am):
+    # Current size of the function, whether it lives in the CFG or the list
+    if 'cfg' in am.cache:
+        return sum(len(block) for block in am.cache['cfg'].blocks.values())
+    return sum(1 for instr in am.func.get('instrs', []) if 'op' in instr)
+
+def run_pipeline(prog, passes, effects=None):
+    if effects is None:
+        effects = call_effects(prog)
+    managers = [AnalysisManager(func, effects) for func in prog.get('functions', [])]
+    for name in passes:
+        kind, fn, preserves = PASSES[name]
+        if kind == 'program':
+            for am in managers:
+                am.sync()
+            with instrument.scope('pass', name):
+                prog = fn(prog)
+            effects = call_effects(prog)
+            managers = [AnalysisManager(func, effects) for func in prog.get('functions', [])]
+        else:
+            for am in managers:
+                if 'cfg' not in preserves:
+                    # The pass may read func['instrs'] directly
+                    am.sync()
+                with instrument.scope('pass', name, am.func.get('name')) as record:
+                    if record is not None:
+                        record['instrs_before'] = instruction_count(am)
+                    fn(am.func, am)
+                    am.invalidate(preserves)
+                    if record is not None:
+                        record['instrs_after'] = instruction_count(am)
+    for am in managers:
+        am.sync()
+    return prog
+
+def run_function_passes(passes, func, effects=None):
+    run_pipeline({'functions': [func]}, passes, effects)
+
+def run_pipeline_segments(prog, passes, jobs=1, function_cache=None):
+    # Runs of consecutive function passes go to the worker pool (or come out
+    # of the cache) one function at a time; program passes run here in
+    # between. Each worker gets the call-effect summaries of the whole program.
+    version = cache.code_version() if function_cache else None
+    i = 0
+    while i < len(passes):
+        if PASSES[passes[i]][0] == 'program':
+            prog = PASSES[passes[i]][1](prog)
+            i += 1
+            continue
+        j = i
+        while j < len(passes) and PASSES[passes[j]][0] == 'function':
+            j += 1
+        effects = call_effects(prog)
+        optimize = partial(run_function_passes, passes[i:j], effects=effects)
+        if 'functions' in prog and function_cache:
+            # What a function turns into depends on what its callees do
+            pipeline = ','.join(passes[i:j]) + ':' + version + ':' + effects.digest()
+            prog['functions'] = cache.cached_map(function_cache, pipeline, optimize,
+                                                 prog['functions'], jobs)
+        elif 'functions' in prog:
+            prog['functions'] = map_functions(optimize, prog['functions'], jobs)
+        i = j
+    return prog
+
+def main():
+    parser = argparse.ArgumentParser(description='Run several optimization passes in one process.')
+    parser.add_argument('--passes', required=True,
+                        help='comma-separated pass list, e.g. global_dce,lvn,local_dce,licm,constprop')
+    parser.add_argument('--ir', action='store_true',
+                        help='run the passes on the compact slot-based IR instead of JSON dicts')
+    parser.add_argument('--stream', action='store_true',
+                        help='read, optimize and write one function at a time')
+    parser.add_argument('--pretty', action='store_true', help='indent the JSON output')
+    parser.add_argument('--stats', action='store_true',
+                        help=f"print per-pass and per-analysis statistics to stderr as JSON lines "
+                             f"(same as {instrument.ENV}=1)")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help='optimize functions in N worker processes (0: one per core)')
+    parser.add_argument('--cache', metavar='DIR',
+                        help='reuse optimized functions from earlier runs, stored under DIR')
+    parser.add_argument('--cache-size', type=int, default=cache.DEFAULT_MAX_BYTES >> 20, metavar='MB',
+                        help='evict least recently used cache entries beyond this size')
+    args = parser.parse_args()
+    if args.stats:
+        instrument.enable()
+
+    try:
+        passes = parse_passes(args.passes)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(2)
+
+    if args.stream and (args.jobs != 1 or args.cache):
+        print("Error: --stream cannot be combined with --jobs or --cache", file=sys.stderr)
+        sys.exit(2)
+
+    if args.stream:
+        program_passes = [name for name in passes if PASSES[name][0] == 'program']
+        if program_passes:
+            print(f"Error: {', '.join(program_passes)} needs the whole program and cannot run with --stream",
+                  file=sys.stderr)
+            sys.exit(2)
+        types = {}
+
+        def transform(func):
+            if args.ir:
+                func = function_from_json(func, types)
+            run_pipeline({'functions': [func]}, passes)
+            return func
+
+        bril_json.stream_program(sys.stdin, sys.stdout, transform, args.pretty)
+        return
+
+    prog = bril_json.load(sys.stdin)
+    if args.ir:
+        prog = program_from_json(prog)
+    if args.jobs != 1 or args.cache:
+        function_cache = args.cache and cache.FunctionCache(args.cache, args.cache_size << 20)
+        prog = run_pipeline_segments(prog, passes, args.jobs, function_cache)
+    else:
+        prog = run_pipeline(prog, passes)
+    if args.ir:
+        prog = program_to_json(prog)
+    bril_json.dump(prog, sys.stdout, args.pretty)
+
+if __name__ == '__main__':
+    main()
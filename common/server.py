@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import signal
+import socketserver
+import sys
+
+import bril_json
+from client import default_socket_path
+from pipeline import parse_passes, run_pipeline
+
+# A resident optimizer: passes are imported once and then serve any number
+# of programs. Framing is one JSON object per line in each direction:
+#
+#   request:  {"passes": "global_dce,lvn", "program": {...}}
+#   response: {"program": {...}}   or   {"error": "..."}
+#
+# over stdin/stdout, or over a Unix socket with `--socket PATH`.
+
+def handle_request(line):
+    try:
+        request = bril_json.loads(line)
+        passes = request['passes']
+        if isinstance(passes, list):
+            passes = ','.join(passes)
+        prog = run_pipeline(request['program'], parse_passes(passes))
+        response = {'program': prog}
+    except Exception as e:
+        # One bad request must not take the server down
+        response = {'error': f"{type(e).__name__}: {e}"}
+    return bril_json.dumps(response) + '\n'
+
+def serve_stream(fin, fout):
+    for line in fin:
+        if line.strip():
+            fout.write(handle_request(line))
+            fout.flush()
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            if line.strip():
+                self.wfile.write(handle_request(line).encode())
+                self.wfile.flush()
+
+class ForkingUnixServer(socketserver.ForkingMixIn, socketserver.UnixStreamServer):
+    # Each connection gets a forked child, which starts with every pass
+    # already imported
+    pass
+
+def serve_socket(path):
+    if os.path.exists(path):
+        os.unlink(path)
+    # Exit through the finally below on `kill` too, so the socket file goes
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    with ForkingUnixServer(path, RequestHandler) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(path)
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve optimization requests without restarting Python.')
+    parser.add_argument('--socket', nargs='?', const=default_socket_path(),
+                        help='listen on a Unix socket (default path: $BRIL_OPT_SOCKET or '
+                             '/tmp/bril-opt-<uid>.sock) instead of stdin/stdout')
+    args = parser.parse_args()
+    if args.socket:
+        serve_socket(args.socket)
+    else:
+        serve_stream(sys.stdin, sys.stdout)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,292 @@
+import instrument
+from dataflow import Liveness
+from dominators import Dominators
+
+UNDEFINED = '__undefined'
+
+class NameSupply:
+    def __init__(self, func, cfg):
+        self.used = {arg['name'] for arg in func.get('args', [])}
+        for block in cfg.blocks.values():
+            for instr in block:
+                if 'dest' in instr:
+                    self.used.add(instr['dest'])
+                self.used.update(instr.get('args', []))
+        self.counters = {}
+
+    def fresh(self, base):
+        n = self.counters.get(base, 0)
+        name = f"{base}.{n}"
+        while name in self.used:
+            n += 1
+            name = f"{base}.{n}"
+        self.counters[base] = n + 1
+        self.used.add(name)
+        return name
+
+def has_phis(cfg):
+    return any(instr.get('op') == 'phi' for block in cfg.blocks.values() for instr in block)
+
+def def_use_chains(cfg):
+    # For SSA code: each variable's single definition site and all its uses,
+    # as (label, instruction) pairs
+    defs = {}
+    uses = {}
+    for label, block in cfg.blocks.items():
+        for instr in block:
+            if 'dest' in instr:
+                defs[instr['dest']] = (label, instr)
+            for arg in instr.get('args', []):
+                uses.setdefault(arg, []).append((label, instr))
+    return defs, uses
+
+def to_ssa(func, am):
+    cfg = am.get('cfg')
+    if not cfg.blocks or has_phis(cfg):
+        return
+
+    # Unreachable code has no place in the dominator tree; drop it
+    reachable = cfg.reachable()
+    for label in list(cfg.blocks):
+        if label not in reachable:
+            cfg.remove_block(label)
+
+    # Phis need an entry block that nothing jumps back to
+    if cfg.preds[cfg.entry]:
+        old_entry = cfg.entry
+        new_entry = cfg.fresh_label('__entry')
+        cfg.insert_block(new_entry, [], before=old_entry)
+        cfg.add_edge(new_entry, old_entry)
+
+    dom = Dominators(cfg)
+    liveness = Liveness(cfg)
+    names = NameSupply(func, cfg)
+
+    types = {arg['name']: arg['type'] for arg in func.get('args', [])}
+    def_blocks = {}
+    for label, block in cfg.blocks.items():
+        for instr in block:
+            if 'dest' in instr:
+                types.setdefault(instr['dest'], instr.get('type'))
+                def_blocks.setdefault(instr['dest'], set()).add(label)
+
+    # Pruned phi placement: iterated dominance frontier, but only where the
+    # variable is live on entry
+    phis = {label: {} for label in cfg.blocks}     # label -> var -> phi instruction
+    for var, blocks in def_blocks.items():
+        worklist = list(blocks)
+        placed = set()
+        while worklist:
+            label = worklist.pop()
+            for frontier in dom.frontiers[label]:
+                if frontier in placed:
+                    continue
+                placed.add(frontier)
+                if liveness.is_live(liveness.live_in[frontier], var):
+                    phis[frontier][var] = {'op': 'phi', 'dest': var, 'type': types[var],
+                                           'args': [], 'labels': []}
+                if frontier not in blocks:
+                    worklist.append(frontier)
+
+    # Rename along the dominator tree
+    stacks = {arg['name']: [arg['name']] for arg in func.get('args', [])}
+
+    def current(var):
+        stack = stacks.get(var)
+        return stack[-1] if stack else UNDEFINED
+
+    def rename(label):
+        pushed = []
+        for var, phi in phis[label].items():
+            phi['dest'] = names.fresh(var)
+            stacks.setdefault(var, []).append(phi['dest'])
+            pushed.append(var)
+
+        for instr in cfg.blocks[label]:
+            if 'args' in instr:
+                instr['args'] = [current(arg) for arg in instr['args']]
+            if 'dest' in instr:
+                var = instr['dest']
+                instr['dest'] = names.fresh(var)
+                stacks.setdefault(var, []).append(instr['dest'])
+                pushed.append(var)
+
+        for succ in cfg.succs[label]:
+            for var, phi in phis[succ].items():
+                phi['args'].append(current(var))
+                phi['labels'].append(label)
+        return pushed
+
+    stack = [(dom.rpo[0], False)]
+    pushed_by = {}
+    while stack:
+        label, done = stack.pop()
+        if done:
+            for var in pushed_by.pop(label):
+                stacks[var].pop()
+            continue
+        pushed_by[label] = rename(label)
+        stack.append((label, True))
+        for child in reversed(dom.children[label]):
+            stack.append((child, False))
+
+    for label, block_phis in phis.items():
+        if block_phis:
+            cfg.blocks[label][0:0] = list(block_phis.values())
+            instrument.count('phis', len(block_phis))
+
+def split_edge(cfg, src, dst):
+    label = cfg.fresh_label(f"{src}.{dst}")
+    cfg.insert_block(label, [], before=dst)
+    last = cfg.blocks[src][-1]
+    last['labels'] = [label if target == dst else target for target in last['labels']]
+    cfg.remove_edge(src, dst)
+    cfg.add_edge(src, label)
+    cfg.add_edge(label, dst)
+    for instr in cfg.blocks[dst]:
+        if instr.get('op') == 'phi':
+            instr['labels'] = [label if pred == src else pred for pred in instr['labels']]
+    return label
+
+def sequentialize(copies, types, names):
+    # Order a parallel copy so no source is overwritten before it is read,
+    # breaking cycles (swaps) with a temporary
+    pending = {dest: src for dest, src in copies if dest != src}
+    result = []
+    while pending:
+        sources = set(pending.values())
+        ready = [dest for dest in pending if dest not in sources]
+        if ready:
+            for dest in ready:
+                result.append((dest, pending.pop(dest)))
+            continue
+        dest = next(iter(pending))
+        tmp = names.fresh(dest)
+        types[tmp] = types[dest]
+        result.append((tmp, dest))
+        pending = {d: (tmp if s == dest else s) for d, s in pending.items()}
+    return result
+
+def insert_before_terminator(block, instrs):
+    pos = len(block)
+    if block and block[-1].get('op') in ('jmp', 'br', 'ret'):
+        pos -= 1
+    block[pos:pos] = instrs
+
+def from_ssa(func, am):
+    cfg = am.get('cfg')
+    if not has_phis(cfg):
+        return
+    names = NameSupply(func, cfg)
+    types = {}
+    split = []
+
+    # Copies for a phi go at the end of each predecessor; an edge out of a
+    # block with several successors gets a block of its own first
+    for label in list(cfg.blocks):
+        block = cfg.blocks[label]
+        if not any(instr.get('op') == 'phi' for instr in block):
+            continue
+        for pred in list(cfg.preds[label]):
+            if len(cfg.succs[pred]) > 1:
+                split.append((pred, split_edge(cfg, pred, label), label))
+
+        copies = {}
+        rest = []
+        for instr in cfg.blocks[label]:
+            if instr.get('op') != 'phi':
+                rest.append(instr)
+                continue
+            types[instr['dest']] = instr['type']
+            for arg, pred in zip(instr['args'], instr['labels']):
+                if arg != UNDEFINED and pred in cfg.blocks:
+                    copies.setdefault(pred, []).append((instr['dest'], arg))
+        cfg.blocks[label] = rest
+
+        for pred, pred_copies in copies.items():
+            sequence = sequentialize(pred_copies, types, names)
+            insert_before_terminator(cfg.blocks[pred], [
+                {'op': 'id', 'dest': dest, 'type': types[dest], 'args': [src]}
+                for dest, src in sequence
+            ])
+            instrument.count('copies', len(sequence))
+
+    coalesce_copies(func, cfg)
+
+    # Edge blocks whose copies were all coalesced away are not needed
+    for src, label, dst in split:
+        if not cfg.blocks[label]:
+            last = cfg.blocks[src][-1]
+            last['labels'] = [dst if target == label else target for target in last['labels']]
+            cfg.remove_block(label)
+            cfg.add_edge(src, dst)
+
+def coalesce_copies(func, cfg):
+    # Merge the two sides of an `id` copy when their live ranges do not
+    # interfere, then drop copies that became self-assignments
+    liveness = Liveness(cfg)
+    decode = liveness.interner.decode
+    types = {arg['name']: arg['type'] for arg in func.get('args', [])}
+    interference = {}
+
+    def interfere(a, b):
+        if a != b:
+            interference.setdefault(a, set()).add(b)
+            interference.setdefault(b, set()).add(a)
+
+    for label, block in cfg.blocks.items():
+        live_out = liveness.instr_live_out(label)
+        for instr, live in zip(block, live_out):
+            if 'dest' not in instr:
+                continue
+            dest = instr['dest']
+            types.setdefault(dest, instr.get('type'))
+            source = instr['args'][0] if instr.get('op') == 'id' else None
+            for other in decode(live):
+                if other != source:
+                    interfere(dest, other)
+
+    parent = {}
+
+    def find(var):
+        root = var
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while var != root:
+            parent[var], var = root, parent.get(var, var)
+        return root
+
+    members = {}
+    params = {arg['name'] for arg in func.get('args', [])}
+    for block in cfg.blocks.values():
+        for instr in block:
+            if instr.get('op') != 'id':
+                continue
+            a, b = find(instr['dest']), find(instr['args'][0])
+            if a == b or types.get(a) != types.get(b):
+                continue
+            if interference.get(a, set()) & members.get(b, {b}) or interference.get(b, set()) & members.get(a, {a}):
+                continue
+            group_a = members.pop(a, {a})
+            group_b = members.pop(b, {b})
+            if group_a & params and group_b & params:
+                members[a], members[b] = group_a, group_b
+                continue
+            # Function parameters keep their names
+            root, other = (b, a) if group_b & params else (a, b)
+            parent[other] = root
+            members[root] = group_a | group_b
+            interference[root] = interference.get(a, set()) | interference.get(b, set())
+
+    for label, block in cfg.blocks.items():
+        new_block = []
+        for instr in block:
+            if 'args' in instr:
+                instr['args'] = [find(arg) for arg in instr['args']]
+            if 'dest' in instr:
+                instr['dest'] = find(instr['dest'])
+                if instr.get('op') == 'id' and instr['args'][0] == instr['dest']:
+                    instrument.count('coalesced')
+                    continue
+            new_block.append(instr)
+        cfg.blocks[label] = new_block
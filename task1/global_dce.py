@@ -1,11 +1,19 @@
-import json
+import os
 import sys
 
-def is_pure(instr):
-    # Safely access 'op' using instr.get('op')
-    return instr.get('op', None) not in ['call', 'store', 'print']
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import bril_json
+from callgraph import UNKNOWN_EFFECTS, call_effects
+
+def is_pure(instr, effects=UNKNOWN_EFFECTS):
+    # Safely access 'op' using instr.get('op'); calls to functions that
+    # always return and do nothing else are as good as arithmetic
+    if instr.get('op', None) == 'call':
+        return effects.is_total(instr)
+    return instr.get('op', None) not in ['store', 'print']
 
 def global_dce(program):
+    effects = call_effects(program)
     used_vars = set()
     
     # First pass: collect all used variables
@@ -18,20 +26,18 @@ def global_dce(program):
     for func in program['functions']:
         new_instrs = []
         for instr in func['instrs']:
-            if not is_pure(instr) or 'dest' not in instr or instr['dest'] in used_vars:
+            if not is_pure(instr, effects) or 'dest' not in instr or instr['dest'] in used_vars:
                 new_instrs.append(instr)
                 if 'args' in instr:
                     used_vars.update(instr['args'])
-            elif instr.get('op') == 'const' and 'dest' in instr and instr['dest'] not in used_vars:
-                # Skip unused constants
-                continue
-            else:
-                new_instrs.append(instr)  # Keep other instructions
+            # Otherwise an unused result of a pure instruction (total calls
+            # included): drop it
         func['instrs'] = new_instrs
     
     return program
 
 if __name__ == "__main__":
-    prog = json.load(sys.stdin)
+    # Needs every function at once, so there is no --stream mode
+    prog = bril_json.load(sys.stdin)
     optimized_prog = global_dce(prog)
-    json.dump(optimized_prog, sys.stdout, indent=2)
+    bril_json.dump(optimized_prog, sys.stdout, pretty='--pretty' in sys.argv[1:])
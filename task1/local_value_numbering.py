@@ -1,119 +1,272 @@
-import json
+import os
 import sys
 
-def local_value_numbering(block):
-    value_table = {}
-    var_to_num = {}
-    num_to_var = {}
-    next_num = 0
-    commutative_ops = {'add', 'mul'}
-    optimized_block = []
-
-    for instr in block:
-        if 'op' not in instr:
-            # Keep instructions without 'op' as-is (e.g., labels)
-            optimized_block.append(instr)
-            continue
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import instrument
+from analysis import AnalysisManager, CFG_ANALYSES
+from alias import NoAliasInfo
+from bril_json import run_function_pass
+from callgraph import UNKNOWN_EFFECTS, VALUE_OPS
+from ir import Instr
+
+# Only straight-line code inside blocks is rewritten; terminators stay put
+PRESERVES = CFG_ANALYSES
+
+# Operations whose result depends only on their operands, as do calls to
+# pure functions. Anything else (other calls, load, alloc, phi, unknown
+# extensions) gets a fresh value number.
+PURE_OPS = VALUE_OPS
+COMMUTATIVE = frozenset({'add', 'mul', 'eq', 'ne', 'and', 'or', 'fadd', 'fmul', 'feq', 'ceq'})
+# a > b is b < a, and so on
+MIRRORED = {'gt': 'lt', 'ge': 'le', 'fgt': 'flt', 'fge': 'fle', 'cgt': 'clt', 'cge': 'cle'}
+# Operations that leave memory as it was. Any other (free, impure calls,
+# unknown extensions) forgets every load; a store forgets those it may alias.
+MEMORY_NEUTRAL = PURE_OPS | {'load', 'alloc', 'print', 'nop', 'jmp', 'br', 'ret', 'phi'}
+
+MISSING = object()
+
+class ValueNumbering:
+    # Value numbers are ints. Expressions, variables and the variable that
+    # holds each value live in scoped tables: entering a block marks the
+    # undo log, leaving it rolls back, so a block sees exactly what its
+    # dominators computed.
+    #
+    # Only variables in `single_defs` (defined once, like SSA names) can
+    # carry a value into another block: with one definition, whatever it
+    # holds when a dominated block runs is what the dominator computed.
+    # Other variables are tracked within the current block only, and stop
+    # holding a value as soon as they are reassigned.
+    #
+    # Loads are numbered within a block: `memory` maps the value number of
+    # an address to the number of what was last loaded from or stored to it,
+    # and the variable the address was in, for asking `alias` which entries
+    # a store may overwrite.
+    def __init__(self, single_defs=frozenset(), effects=UNKNOWN_EFFECTS, alias=None):
+        self.single_defs = single_defs
+        self.effects = effects
+        self.alias = alias or NoAliasInfo()
+        self.next_number = 0
+        self.exprs = {}
+        self.var_numbers = {}
+        self.holders = {}
+        self.log = []
+        self.local_numbers = {}
+        self.local_holders = {}
+        self.memory = {}
+
+    def fresh(self):
+        self.next_number += 1
+        return self.next_number
+
+    def scoped_set(self, table, key, value):
+        self.log.append((table, key, table.get(key, MISSING)))
+        table[key] = value
+
+    def enter(self):
+        self.local_numbers = {}
+        self.local_holders = {}
+        self.memory = {}
+        return len(self.log)
+
+    def leave(self, mark):
+        while len(self.log) > mark:
+            table, key, old = self.log.pop()
+            if old is MISSING:
+                del table[key]
+            else:
+                table[key] = old
+
+    def number_of(self, var):
+        number = self.local_numbers.get(var)
+        if number is None:
+            number = self.var_numbers.get(var)
+        if number is None:
+            # Defined in a block that does not dominate this one, or before
+            # this block: unknown, but the same until it is reassigned
+            number = self.local_numbers[var] = self.fresh()
+        return number
+
+    def holder(self, number):
+        var = self.local_holders.get(number)
+        if var is not None and self.local_numbers.get(var) == number:
+            return var
+        return self.holders.get(number)
+
+    def define(self, var, number):
+        if var in self.single_defs:
+            self.local_numbers.pop(var, None)
+            self.scoped_set(self.var_numbers, var, number)
+            if number not in self.holders:
+                self.scoped_set(self.holders, number, var)
+            return
+        old = self.local_numbers.get(var)
+        if old is not None and self.local_holders.get(old) == var:
+            del self.local_holders[old]
+        self.local_numbers[var] = number
+        if self.holder(number) is None:
+            self.local_holders[number] = var
+
+    def key(self, instr, op, args):
+        if op == 'const':
+            # repr() keeps true, 1 and 1.0 apart
+            return ('const', str(instr.get('type')), repr(instr['value']))
+        numbers = [self.number_of(arg) for arg in args]
+        if op == 'call':
+            return ('call', instr['funcs'][0]) + tuple(numbers)
+        if op in MIRRORED:
+            op = MIRRORED[op]
+            numbers.reverse()
+        elif op in COMMUTATIVE:
+            numbers.sort()
+        return (op,) + tuple(numbers)
+
+    def store(self, address, value):
+        for number, (_, var) in list(self.memory.items()):
+            if self.alias.may_alias(var, address):
+                del self.memory[number]
+        self.memory[self.number_of(address)] = (self.number_of(value), address)
 
-        if 'dest' in instr:
-            # Handle 'call', 'store', 'load' instructions separately
-            if instr['op'] in ('call', 'store', 'load'):
-                # Assign a unique value number; do not optimize
-                num = f"vn{next_num}"
-                next_num += 1
-                num_to_var[num] = instr['dest']
-                var_to_num[instr['dest']] = num
+    def load(self, address):
+        # The number of what the address holds, and a variable holding it
+        # now if this load is redundant
+        number = self.number_of(address)
+        known = self.memory.get(number)
+        if known is not None:
+            holder = self.holder(known[0])
+            if holder is not None:
+                return known[0], holder
+        value = self.fresh()
+        self.memory[number] = (value, address)
+        return value, None
+
+    def number_block(self, block):
+        optimized_block = []
+        for instr in block:
+            if type(instr) is Instr:
+                op, dest, args = instr.op, instr.dest_name(), instr.decoded_args() or ()
+            else:
+                op, dest, args = instr.get('op'), instr.get('dest'), instr.get('args', ())
+            if op == 'store':
+                self.store(*args)
+            elif op not in MEMORY_NEUTRAL and not self.effects.is_pure(instr):
+                self.memory.clear()
+
+            if op == 'load' and dest is not None:
+                number, holder = self.load(args[0])
+                if holder is not None:
+                    instrument.count('loads_replaced')
+                    instr = {'op': 'id', 'dest': dest, 'type': instr.get('type'), 'args': [holder]}
                 optimized_block.append(instr)
+                self.define(dest, number)
                 continue
 
-            # Process arguments
-            args = instr.get('args', [])
-            args_value_numbers = []
-            for arg in args:
-                if arg in var_to_num:
-                    arg_vn = var_to_num[arg]
-                else:
-                    # Assign a unique identifier to this variable
-                    arg_vn = f"var_{arg}"
-                    var_to_num[arg] = arg_vn
-                    num_to_var[arg_vn] = arg
-                args_value_numbers.append(arg_vn)
-
-            if instr['op'] in commutative_ops:
-                # Sort the arguments
-                args_value_numbers = sorted(args_value_numbers)
-
-            # Create a value key for the instruction
-            if instr['op'] == 'const':
-                value = ('const', instr['value'])
-            else:
-                value = (instr['op'],) + tuple(args_value_numbers)
+            if dest is None:
+                # Reads its arguments, but defines nothing to number
+                optimized_block.append(instr)
+                continue
+
+            if op not in PURE_OPS and not self.effects.is_pure(instr):
+                self.define(dest, self.fresh())
+                optimized_block.append(instr)
+                continue
 
-            if value in value_table:
+            if op == 'id':
+                # A copy has its source's value number
+                self.define(dest, self.number_of(args[0]))
+                optimized_block.append(instr)
+                continue
+
+            key = self.key(instr, op, args)
+            number = self.exprs.get(key)
+            holder = None if number is None else self.holder(number)
+            # A constant is no dearer than the copy that would replace it,
+            # so it stays, but still shares the value number
+            if holder is not None and op != 'const':
                 # Redundant computation found
-                num = value_table[value]
+                instrument.count('replaced')
                 optimized_block.append({
                     'op': 'id',
-                    'dest': instr['dest'],
+                    'dest': dest,
                     'type': instr.get('type'),
-                    'args': [num_to_var[num]]
+                    'args': [holder]
                 })
             else:
-                # New computation
-                num = f"vn{next_num}"
-                next_num += 1
-                value_table[value] = num
-                num_to_var[num] = instr['dest']
+                if number is None:
+                    number = self.fresh()
+                    self.scoped_set(self.exprs, key, number)
                 optimized_block.append(instr)
+            self.define(dest, number)
+        return optimized_block
+
+def local_value_numbering(block, effects=UNKNOWN_EFFECTS, alias=None):
+    numbering = ValueNumbering(effects=effects, alias=alias)
+    numbering.enter()
+    return numbering.number_block(block)
 
-            var_to_num[instr['dest']] = num
-        else:
-            # Instructions without 'dest' are added as-is
-            optimized_block.append(instr)
+def single_definitions(func, cfg):
+    counts = {}
+    for arg in func.get('args', []):
+        counts[arg['name']] = counts.get(arg['name'], 0) + 1
+    for block in cfg.blocks.values():
+        for instr in block:
+            dest = instr.get('dest')
+            if dest is not None:
+                counts[dest] = counts.get(dest, 0) + 1
+    return frozenset(var for var, n in counts.items() if n == 1)
 
-    return optimized_block
+def global_value_numbering(func, am):
+    # Walks the dominator tree, so an expression computed in a block is
+    # reused in every block it dominates, not only further down its own
+    cfg = am.get('cfg')
+    dom = am.get('dominators')
+    alias = am.get('points_to')
+    numbering = ValueNumbering(single_definitions(func, cfg), am.effects, alias)
+    for arg in func.get('args', []):
+        if arg['name'] in numbering.single_defs:
+            numbering.define(arg['name'], numbering.fresh())
 
-def split_basic_blocks(instrs):
-    blocks = []
-    current_block = []
-    labels = set()
+    stack = [(dom.rpo[0], None)] if dom.rpo else []
+    while stack:
+        label, mark = stack.pop()
+        if mark is not None:
+            numbering.leave(mark)
+            continue
+        mark = numbering.enter()
+        cfg.blocks[label] = numbering.number_block(cfg.blocks[label])
+        stack.append((label, mark))
+        for child in reversed(dom.children[label]):
+            stack.append((child, None))
 
-    # Collect all labels
-    for instr in instrs:
-        if 'label' in instr:
-            labels.add(instr['label'])
+    # Unreachable blocks have no dominators to borrow from
+    for label, block in cfg.blocks.items():
+        if label not in dom.index:
+            cfg.blocks[label] = local_value_numbering(block, am.effects, alias)
 
-    for instr in instrs:
-        if 'label' in instr:
-            # Start a new block with the label
-            if current_block:
-                blocks.append(current_block)
-            current_block = [instr]
-        else:
-            current_block.append(instr)
-            # If the instruction is a jump, branch, or return, end the current block
-            if instr.get('op') in ('jmp', 'br', 'ret'):
-                blocks.append(current_block)
-                current_block = []
+def local_value_numbering_function(func, am=None):
+    standalone = am is None
+    if standalone:
+        am = AnalysisManager(func)
 
-    if current_block:
-        blocks.append(current_block)
+    cfg = am.get('cfg')
+    alias = am.get('points_to')
+    for label, block in cfg.blocks.items():
+        cfg.blocks[label] = local_value_numbering(block, am.effects, alias)
 
-    return blocks
+    if standalone:
+        am.sync()
 
-def local_value_numbering_function(func):
-    instrs = func['instrs']
-    blocks = split_basic_blocks(instrs)
-    optimized_instrs = []
+def global_value_numbering_function(func, am=None):
+    standalone = am is None
+    if standalone:
+        am = AnalysisManager(func)
 
-    for block in blocks:
-        optimized_block = local_value_numbering(block)
-        optimized_instrs.extend(optimized_block)
+    global_value_numbering(func, am)
 
-    func['instrs'] = optimized_instrs
+    if standalone:
+        am.sync()
 
 if __name__ == "__main__":
-    prog = json.load(sys.stdin)
-    for func in prog["functions"]:
-        local_value_numbering_function(func)
-    json.dump(prog, sys.stdout, indent=2)
+    if '--global' in sys.argv[1:]:
+        run_function_pass(global_value_numbering_function)
+    else:
+        run_function_pass(local_value_numbering_function)
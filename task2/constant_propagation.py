@@ -1,219 +1,307 @@
-import json
+import heapq
+import os
 import sys
+from functools import partial
 from typing import Dict, Set, List, Tuple, Optional
 
-class BasicBlock:
-    def __init__(self, label: str):
-        self.label = label
-        self.instructions = []
-        self.predecessors = set()
-        self.successors = set()
-        self.dominator = None
-        self.loop_header = None
-
-def build_cfg(func):
-    blocks = {}
-    current_block = None
-    
-    for instr in func['instrs']:
-        if 'label' in instr:
-            if current_block:
-                blocks[current_block.label] = current_block
-            current_block = BasicBlock(instr['label'])
-        else:
-            if not current_block:
-                # Create an entry block if we start with non-label instruction
-                current_block = BasicBlock("__entry")
-            current_block.instructions.append(instr)
-            
-            if 'op' in instr and instr['op'] in ['jmp', 'br']:
-                current_block.successors.update(instr.get('labels', []))
-                blocks[current_block.label] = current_block
-                current_block = None
-
-    # Add the last block if it's not already added
-    if current_block and current_block.instructions:
-        blocks[current_block.label] = current_block
-
-    # Set predecessors
-    for label, block in blocks.items():
-        for succ_label in block.successors:
-            if succ_label in blocks:
-                blocks[succ_label].predecessors.add(label)
-            else:
-                # Create a new block for unknown successors
-                new_block = BasicBlock(succ_label)
-                new_block.predecessors.add(label)
-                blocks[succ_label] = new_block
-
-    return blocks
-
-
-def compute_dominators(blocks, entry_label):
-    dom = {label: set(blocks.keys()) for label in blocks}
-    dom[entry_label] = {entry_label}
-    changed = True
-    while changed:
-        changed = False
-        for label in blocks:
-            if label == entry_label:
-                continue
-            new_dom = {label} | set.intersection(*(dom[p] for p in blocks[label].predecessors))
-            if new_dom != dom[label]:
-                dom[label] = new_dom
-                changed = True
-    return dom
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import instrument
+from analysis import AnalysisManager
+from bril_json import run_function_pass
+from callgraph import UNKNOWN_EFFECTS, VALUE_OPS
+from dataflow import Liveness, solve
+
+# Branch folding rewrites terminators, so nothing survives this pass
+PRESERVES = ()
 
-def identify_loops(blocks, dom):
-    for header, block in blocks.items():
-        for pred in block.predecessors:
-            if header in dom[pred]:
-                blocks[pred].loop_header = header
+def meet_constants(values):
+    # A variable stays constant only if every incoming edge agrees on its value.
+    # None marks predecessors that have not been reached yet.
+    known = [v for v in values if v is not None]
+    if not known:
+        return None
+    result = known[0]
+    for other in known[1:]:
+        result = {var: val for var, val in result.items() if var in other and other[var] == val}
+    return result
 
-def is_pure(instr):
-    return instr.get('op') not in ['call', 'store', 'print', 'alloc', 'free']
+def is_pure(instr, effects=UNKNOWN_EFFECTS):
+    # A call is only as pure as its callee
+    if instr.get('op') == 'call':
+        return effects.is_total(instr)
+    return instr.get('op') not in ['store', 'print', 'alloc', 'free']
+
+INT_MIN = -2 ** 63
+
+def wrap(value):
+    # Bril integers are 64-bit two's complement
+    return (value - INT_MIN) % 2 ** 64 + INT_MIN
+
+def evaluate(op, vals):
+    # Fold one operation over constant operands; None when it cannot be folded
+    # (unknown op, division by zero, ...) so the runtime behaviour is kept
+    if op == 'id':
+        return vals[0]
+    if op == 'not':
+        return not vals[0]
+    if len(vals) != 2:
+        return None
+    val1, val2 = vals
+    if op == 'add':
+        return wrap(val1 + val2)
+    if op == 'mul':
+        return wrap(val1 * val2)
+    if op == 'sub':
+        return wrap(val1 - val2)
+    if op == 'div':
+        if val2 == 0:
+            return None
+        quotient = abs(val1) // abs(val2)
+        return wrap(quotient if (val1 < 0) == (val2 < 0) else -quotient)
+    if op == 'eq':
+        return val1 == val2
+    if op == 'lt':
+        return val1 < val2
+    if op == 'gt':
+        return val1 > val2
+    if op == 'le':
+        return val1 <= val2
+    if op == 'ge':
+        return val1 >= val2
+    if op == 'ne':
+        return val1 != val2
+    if op == 'and':
+        return val1 and val2
+    if op == 'or':
+        return val1 or val2
+    return None
+
+# The value-only operations evaluate() knows how to compute
+FOLDABLE = VALUE_OPS & {'id', 'not', 'add', 'mul', 'sub', 'div', 'eq', 'lt', 'gt', 'le', 'ge', 'ne', 'and', 'or'}
 
 def constant_fold(instr, constants):
-    if 'op' in instr and instr['op'] in ['add', 'mul', 'sub', 'div', 'eq', 'lt', 'gt', 'le', 'ge', 'ne']:
-        if all(arg in constants for arg in instr['args']):
-            val1, val2 = [constants[arg] for arg in instr['args']]
-            result = None
-            if instr['op'] == 'add':
-                result = val1 + val2
-            elif instr['op'] == 'mul':
-                result = val1 * val2
-            elif instr['op'] == 'sub':
-                result = val1 - val2
-            elif instr['op'] == 'div' and val2 != 0:
-                result = val1 // val2
-            elif instr['op'] == 'eq':
-                result = int(val1 == val2)
-            elif instr['op'] == 'lt':
-                result = int(val1 < val2)
-            elif instr['op'] == 'gt':
-                result = int(val1 > val2)
-            elif instr['op'] == 'le':
-                result = int(val1 <= val2)
-            elif instr['op'] == 'ge':
-                result = int(val1 >= val2)
-            elif instr['op'] == 'ne':
-                result = int(val1 != val2)
-            
+    if instr.get('op') in FOLDABLE and 'dest' in instr:
+        args = instr.get('args', [])
+        if all(arg in constants for arg in args):
+            result = evaluate(instr['op'], [constants[arg] for arg in args])
             if result is not None:
                 return {'op': 'const', 'dest': instr['dest'], 'type': instr['type'], 'value': result}
     return instr
 
-def analyze_block(block: BasicBlock, in_constants: Dict[str, Optional[int]]) -> Tuple[Dict[str, Optional[int]], List[Dict]]:
+def analyze_block(instrs: List[Dict], in_constants: Dict[str, Optional[int]]) -> Tuple[Dict[str, Optional[int]], List[Dict]]:
     constants = in_constants.copy()
     new_instructions = []
     
-    for instr in block.instructions:
+    for instr in instrs:
         folded_instr = constant_fold(instr, constants)
         new_instructions.append(folded_instr)
         
-        if is_pure(folded_instr):
-            if folded_instr['op'] == 'const':
-                constants[folded_instr['dest']] = folded_instr['value']
-            elif 'dest' in folded_instr:
-                if block.loop_header:
-                    constants[folded_instr['dest']] = None  # Not a constant in a loop
-                else:
-                    constants.pop(folded_instr['dest'], None)
+        if folded_instr.get('op') == 'const':
+            constants[folded_instr['dest']] = folded_instr['value']
+        elif 'dest' in folded_instr:
+            # Anything else (calls and loads included) makes the variable unknown
+            constants.pop(folded_instr['dest'], None)
     
     return constants, new_instructions
 
-def constant_propagation(func):
-    blocks = build_cfg(func)
-    if not blocks:
+def constant_propagation(func, am):
+    cfg = am.get('cfg')
+    if not cfg.blocks:
         return func['instrs']
     
-    entry_label = "__entry" if "__entry" in blocks else next(iter(blocks))
+    def transfer(label, in_constants):
+        if in_constants is None:
+            return None
+        return analyze_block(cfg.blocks[label], in_constants)[0]
+    
+    in_constants, _ = solve(cfg, transfer, meet_constants, None, {})
+    
+    folded = 0
+    for label, block in cfg.blocks.items():
+        if in_constants[label] is not None:
+            new_block = analyze_block(block, in_constants[label])[1]
+            folded += sum(1 for old, new in zip(block, new_block) if old is not new)
+            cfg.blocks[label] = new_block
+    instrument.count('folded', folded)
+    
+    return cfg.to_instrs()
+
+# Three-level lattice for SCCP: a variable is TOP (no value seen yet), a
+# constant, or BOTTOM (overdefined). Constants are stored as themselves.
+TOP = object()
+BOTTOM = object()
+
+def meet_value(a, b):
+    if a is TOP:
+        return b
+    if b is TOP or a == b and type(a) is type(b):
+        return a
+    return BOTTOM
+
+def sccp_block(instrs, values, label=None, executable=()):
+    # Abstract execution of one block; returns the values at its end.
+    # In SSA form a phi only meets the arguments of executable edges.
+    values = dict(values)
+    for instr in instrs:
+        if 'dest' not in instr:
+            continue
+        op = instr.get('op')
+        if op == 'const':
+            result = instr['value']
+        elif op == 'phi':
+            result = TOP
+            for arg, pred in zip(instr['args'], instr['labels']):
+                if (pred, label) in executable:
+                    result = meet_value(result, values.get(arg, TOP))
+        elif op in FOLDABLE:
+            args = [values.get(arg, TOP) for arg in instr.get('args', [])]
+            if BOTTOM in args:
+                result = BOTTOM
+            elif TOP in args:
+                result = TOP
+            else:
+                result = evaluate(op, args)
+                if result is None:
+                    result = BOTTOM
+        else:
+            # Calls, loads, allocations, floats, ...
+            result = BOTTOM
+        values[instr['dest']] = result
+    return values
+
+def taken_successors(cfg, label, values):
+    # Successor edges that can execute given the values at the block's end
+    block = cfg.blocks[label]
+    last = block[-1] if block else {}
+    if last.get('op') != 'br':
+        return cfg.succs[label]
+    cond = values.get(last['args'][0], TOP)
+    if cond is TOP:
+        return []
+    if cond is BOTTOM:
+        return cfg.succs[label]
+    return [last['labels'][0] if cond else last['labels'][1]]
+
+def sccp(func, am):
+    # Wegman & Zadeck's conditional constant propagation over the (non-SSA)
+    # CFG: values flow only along edges proven executable, so code behind
+    # branches that never go one way does not pollute the meet.
+    cfg = am.get('cfg')
+    if not cfg.blocks:
+        return
     
-    dom = compute_dominators(blocks, entry_label)
-    identify_loops(blocks, dom)
+    order = list(cfg.blocks)
+    priority = {label: i for i, label in enumerate(order)}
+    args = {arg['name']: BOTTOM for arg in func.get('args', [])}
     
-    in_constants = {label: {} for label in blocks}
-    out_constants = {label: {} for label in blocks}
-    worklist = list(blocks.keys())
+    executable = set()      # (src, dst) edges
+    reached = {cfg.entry}
+    in_values = {}
+    out_values = {}
+    worklist = [priority[cfg.entry]]
+    queued = {cfg.entry}
+    visits = 0
     
     while worklist:
-        label = worklist.pop(0)
-        block = blocks[label]
+        label = order[heapq.heappop(worklist)]
+        queued.discard(label)
+        visits += 1
         
-        new_in = {}
-        if not block.predecessors:
-            new_in = {}
-        else:
-            new_in = out_constants[next(iter(block.predecessors))].copy()
-            for pred in block.predecessors:
-                new_in = {var: val for var, val in new_in.items() if var in out_constants[pred] and out_constants[pred][val] == val}
+        incoming = [out_values[p] for p in cfg.preds[label] if (p, label) in executable]
+        if label == cfg.entry:
+            incoming.append(args)
+        values = {}
+        for other in incoming:
+            for var in set(values) | set(other):
+                values[var] = meet_value(values.get(var, TOP), other.get(var, TOP))
+        in_values[label] = values
+        
+        out = sccp_block(cfg.blocks[label], values, label, executable)
+        changed = out != out_values.get(label)
+        out_values[label] = out
         
-        if new_in != in_constants[label]:
-            in_constants[label] = new_in
-            new_out, new_instructions = analyze_block(block, new_in)
-            if new_out != out_constants[label]:
-                out_constants[label] = new_out
-                worklist.extend(block.successors)
-            block.instructions = new_instructions
+        for succ in taken_successors(cfg, label, out):
+            if (label, succ) not in executable:
+                executable.add((label, succ))
+                reached.add(succ)
+                changed = True
+            if changed and succ not in queued:
+                queued.add(succ)
+                heapq.heappush(worklist, priority[succ])
     
-    return reconstruct_function(blocks)
-
-def dead_code_elimination(instrs):
-    used_vars = set()
-    new_instrs = []
+    instrument.count('iterations', visits)
     
-    for instr in reversed(instrs):
-        if 'args' in instr:
-            used_vars.update(instr['args'])
-        
-        if 'op' in instr and instr['op'] in ['br', 'jmp', 'ret'] or not is_pure(instr) or ('dest' in instr and instr['dest'] in used_vars):
-            new_instrs.append(instr)
+    # Rewrite: fold constant definitions and branches in executed blocks
+    folded = branches = 0
+    for label in reached:
+        values = dict(in_values[label])
+        new_instrs = []
+        for instr in cfg.blocks[label]:
+            op = instr.get('op')
             if 'dest' in instr:
-                used_vars.add(instr['dest'])
-        elif 'label' in instr:
-            new_instrs.append(instr)  # Always keep labels
+                values = sccp_block([instr], values, label, executable)
+                result = values[instr['dest']]
+                if (op in FOLDABLE or op == 'phi') and result is not TOP and result is not BOTTOM:
+                    instr = {'op': 'const', 'dest': instr['dest'], 'type': instr['type'], 'value': result}
+                    folded += 1
+            elif op == 'br':
+                taken = taken_successors(cfg, label, values)
+                if len(taken) == 1:
+                    instr = {'op': 'jmp', 'labels': taken}
+                    branches += 1
+                    for succ in list(cfg.succs[label]):
+                        if succ != taken[0]:
+                            cfg.remove_edge(label, succ)
+            new_instrs.append(instr)
+        cfg.blocks[label] = new_instrs
     
-    return list(reversed(new_instrs))
-
-def conditional_constant_propagation(func):
-    instrs = constant_propagation(func)
-    instrs = dead_code_elimination(instrs)
+    instrument.count('folded', folded)
+    instrument.count('branches_folded', branches)
     
-    new_instrs = []
-    skip_until_label = None
-    for instr in instrs:
-        if skip_until_label:
-            if 'label' in instr and instr['label'] == skip_until_label:
-                skip_until_label = None
-            continue
-        
-        if 'op' in instr and instr['op'] == 'br' and 'args' in instr and len(instr['args']) == 1:
-            cond = instr['args'][0]
-            if isinstance(cond, bool) or (isinstance(cond, str) and cond in ['true', 'false']):
-                target_label = instr['labels'][0] if cond == True or cond == 'true' else instr['labels'][1]
-                new_instrs.append({'op': 'jmp', 'labels': [target_label]})
-                skip_until_label = target_label
-            else:
+    # Blocks that can no longer be reached are dropped
+    live_blocks = cfg.reachable()
+    dead_blocks = [label for label in cfg.blocks if label not in live_blocks]
+    for label in dead_blocks:
+        cfg.remove_block(label)
+    instrument.count('blocks_removed', len(dead_blocks))
+
+def dead_code_elimination(cfg, effects=UNKNOWN_EFFECTS):
+    liveness = Liveness(cfg)
+    removed = 0
+    for label, block in cfg.blocks.items():
+        live = liveness.interner.decode(liveness.live_out[label])
+        new_instrs = []
+        for instr in reversed(block):
+            if not is_pure(instr, effects) or 'dest' not in instr or instr['dest'] in live:
                 new_instrs.append(instr)
-        else:
-            new_instrs.append(instr)
+                live.discard(instr.get('dest'))
+                live.update(instr.get('args', []))
+        new_instrs.reverse()
+        removed += len(block) - len(new_instrs)
+        cfg.blocks[label] = new_instrs
+    instrument.count('removed', removed)
+
+def conditional_constant_propagation(func, am=None, mode='sccp'):
+    am = am or AnalysisManager(func)
+    if mode == 'dense':
+        func['instrs'] = constant_propagation(func, am)
+        am = AnalysisManager(func, am.effects)
+    else:
+        sccp(func, am)
     
-    return new_instrs
+    cfg = am.get('cfg')
+    dead_code_elimination(cfg, am.effects)
+    return cfg.to_instrs()
 
-def reconstruct_function(blocks):
-    new_instrs = []
-    for label, block in blocks.items():
-        if label != "__entry":
-            new_instrs.append({'label': label})
-        new_instrs.extend(block.instructions)
-    return new_instrs
+def optimize_function(func, mode='sccp'):
+    func['instrs'] = conditional_constant_propagation(func, mode=mode)
+    return func
 
-def optimize(prog):
+def optimize(prog, mode='sccp'):
     for func in prog['functions']:
-        func['instrs'] = conditional_constant_propagation(func)
+        optimize_function(func, mode)
     return prog
 
 if __name__ == "__main__":
-    prog = json.load(sys.stdin)
-    optimized = optimize(prog)
-    json.dump(optimized, sys.stdout, indent=2)
\ No newline at end of file
+    mode = 'dense' if '--dense' in sys.argv[1:] else 'sccp'
+    run_function_pass(partial(optimize_function, mode=mode))
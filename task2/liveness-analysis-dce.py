@@ -1,9 +1,17 @@
 import json
+import os
 import sys
 from typing import Dict, Set, List
 
-def is_pure(instr):
-    return instr.get('op') not in ['call', 'store', 'print']
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from callgraph import UNKNOWN_EFFECTS, call_effects
+from cfg import CFG
+from dataflow import Liveness
+
+def is_pure(instr, effects=UNKNOWN_EFFECTS):
+    if instr.get('op') == 'call':
+        return effects.is_total(instr)
+    return instr.get('op') not in ['store', 'print']
 
 def get_uses(instr):
     return set(instr.get('args', []))
@@ -11,35 +19,33 @@ def get_uses(instr):
 def get_defs(instr):
     return {instr['dest']} if 'dest' in instr else set()
 
-def analyze_liveness(func):
-    live_vars = set()
-    for instr in reversed(func['instrs']):
-        if 'label' in instr:
-            continue
-        if 'dest' in instr and instr['dest'] in live_vars:
-            live_vars.remove(instr['dest'])
-        live_vars.update(get_uses(instr))
-    return live_vars
-
-def dead_code_elimination(func):
-    live_vars = analyze_liveness(func)
-    new_instrs = []
+def analyze_liveness(cfg):
+    return Liveness(cfg)
+
+def dead_code_elimination(func, effects=UNKNOWN_EFFECTS):
+    cfg = CFG(func)
+    liveness = analyze_liveness(cfg)
     
-    for instr in func['instrs']:
-        if 'label' in instr:
-            new_instrs.append(instr)
-        elif not is_pure(instr) or 'dest' not in instr or instr['dest'] in live_vars:
-            new_instrs.append(instr)
-            if 'dest' in instr:
-                live_vars.add(instr['dest'])
-            live_vars.update(get_uses(instr))
+    for label, block in cfg.blocks.items():
+        # Walk the block backwards from its live-out set, so a dead
+        # instruction's operands only stay live if something else uses them
+        live_vars = liveness.interner.decode(liveness.live_out[label])
+        new_instrs = []
+        for instr in reversed(block):
+            if not is_pure(instr, effects) or 'dest' not in instr or instr['dest'] in live_vars:
+                new_instrs.append(instr)
+                live_vars -= get_defs(instr)
+                live_vars.update(get_uses(instr))
+        new_instrs.reverse()
+        cfg.blocks[label] = new_instrs
     
-    func['instrs'] = new_instrs
+    func['instrs'] = cfg.to_instrs()
     return func
 
 def optimize(prog):
+    effects = call_effects(prog)
     for func in prog['functions']:
-        func = dead_code_elimination(func)
+        func = dead_code_elimination(func, effects)
     return prog
 
 if __name__ == "__main__":
@@ -1,63 +1,286 @@
 import json
+import os
 import sys
+from functools import partial
 from typing import Dict, Set, List, Any, Tuple
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import instrument
+from alias import MemoryLiveness
+from analysis import AnalysisManager, CFG_ANALYSES
+from bril_json import run_function_pass
+from callgraph import VALUE_OPS
+
+# Only non-terminator instructions are deleted
+PRESERVES = CFG_ANALYSES
+# The aggressive mode also rewrites branches and drops blocks
+AGGRESSIVE_PRESERVES = ()
+# Memory DCE only deletes stores, frees, allocs and pointer arithmetic
+MEMORY_PRESERVES = CFG_ANALYSES
+
 def get_uses(instr: Dict[str, Any]) -> Set[str]:
     return set(instr.get('args', []))
 
 def get_defs(instr: Dict[str, Any]) -> Set[str]:
     return {instr['dest']} if 'dest' in instr else set()
 
-def analyze_live_variables(func: Dict[str, Any]) -> List[Set[str]]:
-    instrs = func['instrs']
-    live_out = [set() for _ in instrs]
+def analyze_live_variables(func: Dict[str, Any], am: AnalysisManager) -> Dict[str, List[int]]:
+    # Block-level liveness from the shared bit-vector solver, expanded to the
+    # live-out bitset of every instruction in each block
+    liveness = am.get('liveness')
+    return {label: liveness.instr_live_out(label) for label in am.get('cfg').blocks}
+
+def minimal_dce(func: Dict[str, Any], am: AnalysisManager = None) -> Dict[str, Any]:
+    standalone = am is None
+    if standalone:
+        am = AnalysisManager(func)
+    
+    live_out = analyze_live_variables(func, am)
+    liveness = am.get('liveness')
+    cfg = am.get('cfg')
+    
+    removed = 0
+    for label, block in cfg.blocks.items():
+        new_instrs = []
+        for i, instr in enumerate(block):
+            if (
+                'op' in instr
+                and instr['op'] not in ['const', 'id']
+                or 'dest' not in instr
+                or liveness.is_live(live_out[label][i], instr['dest'])
+            ):
+                new_instrs.append(instr)
+        removed += len(block) - len(new_instrs)
+        cfg.blocks[label] = new_instrs
+    instrument.count('removed', removed)
+    
+    if standalone:
+        am.sync()
+    return func
+
+# Operations with no effect beyond defining their destination: computing a
+# value, and reading or allocating memory
+PURE_OPS = VALUE_OPS | {'nop', 'phi', 'alloc', 'load'}
+
+def use_def_chains(cfg, rd) -> Dict[Tuple[str, int], List[Tuple[str, int]]]:
+    # For every instruction, the definitions its arguments may read
+    def_number = {(label, index): n for n, (label, index, _) in enumerate(rd.defs)}
+    chains = {}
+    for label, block in cfg.blocks.items():
+        reaching = rd.reach_in[label]
+        for i, instr in enumerate(block):
+            chains[(label, i)] = [
+                (def_label, def_index)
+                for arg in instr.get('args', [])
+                for def_label, def_index, _ in rd.decode(reaching & rd.var_defs.get(arg, 0))
+                if def_label is not None
+            ]
+            if 'dest' in instr:
+                reaching = reaching & ~rd.var_defs[instr['dest']] | 1 << def_number[(label, i)]
+    return chains
+
+def aggressive_dce(func: Dict[str, Any], am: AnalysisManager = None, keep_branches: bool = False) -> Dict[str, Any]:
+    # Mark-and-sweep DCE: everything starts dead except side effects, and
+    # liveness spreads backwards along use-def chains and control dependences
+    # in one worklist pass, so there is nothing left to find on a rerun.
+    standalone = am is None
+    if standalone:
+        am = AnalysisManager(func)
+    
+    cfg = am.get('cfg')
+    effects = am.effects
+    chains = use_def_chains(cfg, am.get('reaching_definitions'))
+    pdom = am.get('post_dominators')
+    # Without an exit to post-dominate them (infinite loops), branches must stay
+    if any(label not in pdom for label in cfg.reachable()):
+        keep_branches = True
+    
+    marked = set()
+    live_blocks = set()
+    worklist = []
+    
+    def mark(label, i):
+        if (label, i) not in marked:
+            marked.add((label, i))
+            worklist.append((label, i))
+    
+    def mark_block(label):
+        # A live block keeps alive the branches it is control dependent on
+        if label in live_blocks:
+            return
+        live_blocks.add(label)
+        if keep_branches:
+            return
+        for controller in pdom.frontiers.get(label, ()):
+            block = cfg.blocks.get(controller)
+            if block and block[-1].get('op') == 'br':
+                mark(controller, len(block) - 1)
     
+    for label, block in cfg.blocks.items():
+        for i, instr in enumerate(block):
+            op = instr.get('op')
+            if op == 'call' and effects.is_total(instr):
+                # Only its result matters
+                continue
+            if op not in PURE_OPS and op not in ('jmp', 'br') or op == 'br' and keep_branches:
+                mark(label, i)
+    
+    while worklist:
+        label, i = worklist.pop()
+        mark_block(label)
+        for def_site in chains[(label, i)]:
+            mark(*def_site)
+        instr = cfg.blocks[label][i]
+        if instr.get('op') == 'phi':
+            # Which value a phi picks depends on how control reached it
+            for pred in instr.get('labels', []):
+                if pred in cfg.blocks:
+                    mark_block(pred)
+                    pred_block = cfg.blocks[pred]
+                    if pred_block and pred_block[-1].get('op') == 'br':
+                        mark(pred, len(pred_block) - 1)
+    
+    removed = retargeted = 0
+    for label, block in cfg.blocks.items():
+        new_instrs = []
+        for i, instr in enumerate(block):
+            op = instr.get('op')
+            if (label, i) in marked or op == 'jmp':
+                new_instrs.append(instr)
+            elif op != 'br':
+                removed += 1
+            else:
+                retargeted += 1
+                # Nothing that matters depends on this branch: go straight to
+                # the nearest post-dominator that still does something
+                target = pdom.idom[label]
+                while target != pdom.exit and target not in live_blocks:
+                    target = pdom.idom[target]
+                if target == pdom.exit:
+                    new_instrs.append({'op': 'ret'})
+                else:
+                    new_instrs.append({'op': 'jmp', 'labels': [target]})
+        cfg.blocks[label] = new_instrs
+    
+    cfg.compute_edges()
+    reachable = cfg.reachable()
+    dead_blocks = [label for label in cfg.blocks if label not in reachable]
+    for label in dead_blocks:
+        cfg.remove_block(label)
+    instrument.count('removed', removed)
+    instrument.count('branches_retargeted', retargeted)
+    instrument.count('blocks_removed', len(dead_blocks))
+    
+    if standalone:
+        am.sync()
+    return func
+
+def dead_allocations(cfg, points_to) -> Set[Tuple[str, int]]:
+    # Objects nothing reads: no load may touch them and no pointer to them
+    # escapes or ends up anywhere that stays. Starts from every object that
+    # does not escape and drops those some kept instruction needs.
+    dead = set(points_to.sites) - points_to.escaped
+    
+    def removable(var):
+        targets = points_to.points_to(var)
+        return bool(targets) and targets <= dead
+    
+    def keep(var):
+        needed = points_to.points_to(var) & dead
+        dead.difference_update(needed)
+        return bool(needed)
+    
+    instrs = [instr for block in cfg.blocks.values() for instr in block]
     changed = True
     while changed:
         changed = False
-        for i in reversed(range(len(instrs))):
-            instr = instrs[i]
-            live_in = live_out[i].copy()
-            live_in |= get_uses(instr)
-            live_in -= get_defs(instr)
-            
-            if i > 0 and live_in != live_out[i-1]:
-                live_out[i-1] = live_in
-                changed = True
-    
-    return live_out
+        for instr in instrs:
+            op = instr.get('op')
+            args = instr.get('args', [])
+            if op == 'alloc':
+                continue
+            if op in ('store', 'free') and removable(args[0]):
+                continue
+            if op in ('id', 'ptradd', 'phi') and instr.get('dest') in points_to.pts and removable(instr['dest']):
+                continue
+            for arg in args:
+                if keep(arg):
+                    changed = True
+    return dead
 
-def minimal_dce(func: Dict[str, Any]) -> Dict[str, Any]:
-    live_out = analyze_live_variables(func)
-    new_instrs = []
-    
-    for i, instr in enumerate(func['instrs']):
-        if (
-            'op' in instr
-            and instr['op'] not in ['const', 'id']
-            or 'dest' not in instr
-            or instr.get('dest') in live_out[i]
-            or instr.get('op') in ['print', 'ret', 'br', 'jmp', 'call']
-            or 'label' in instr
-        ):
+def memory_dce(func: Dict[str, Any], am: AnalysisManager = None) -> Dict[str, Any]:
+    # Deletes objects nothing reads (their alloc, stores, free and pointer
+    # arithmetic), then stores no load can see before the cell is
+    # overwritten, freed or the function returns
+    standalone = am is None
+    if standalone:
+        am = AnalysisManager(func)
+    
+    cfg = am.get('cfg')
+    points_to = am.get('points_to')
+    
+    dead = dead_allocations(cfg, points_to)
+    dead_allocs = {id(cfg.blocks[label][i]) for label, i in dead}
+    allocs_removed = 0
+    for label, block in cfg.blocks.items():
+        new_instrs = []
+        for instr in block:
+            op = instr.get('op')
+            if op == 'alloc' and id(instr) in dead_allocs:
+                allocs_removed += 1
+                continue
+            if op in ('store', 'free', 'id', 'ptradd', 'phi'):
+                var = instr['args'][0] if op in ('store', 'free') else instr.get('dest')
+                targets = points_to.points_to(var)
+                if targets and targets <= dead:
+                    continue
+            new_instrs.append(instr)
+        cfg.blocks[label] = new_instrs
+    
+    memory = MemoryLiveness(cfg, points_to)
+    stores_removed = 0
+    for label, block in cfg.blocks.items():
+        live = memory.live_out[label]
+        new_instrs = []
+        for instr in reversed(block):
+            if instr.get('op') == 'store':
+                observers = memory.observers(instr)
+                if observers is not None and not live & observers:
+                    stores_removed += 1
+                    continue
+            reads, kills = memory.transfer(instr)
+            live = reads | (live & ~kills)
             new_instrs.append(instr)
+        new_instrs.reverse()
+        cfg.blocks[label] = new_instrs
+    instrument.count('allocs_removed', allocs_removed)
+    instrument.count('stores_removed', stores_removed)
     
-    func['instrs'] = new_instrs
+    if standalone:
+        am.sync()
     return func
 
-def optimize_function(func: Dict[str, Any]) -> Dict[str, Any]:
-    return minimal_dce(func)
+def optimize_function(func: Dict[str, Any], am: AnalysisManager = None, aggressive: bool = False,
+                      keep_branches: bool = False, memory: bool = False) -> Dict[str, Any]:
+    if memory:
+        memory_dce(func, am)
+    if aggressive:
+        return aggressive_dce(func, am, keep_branches)
+    return minimal_dce(func, am)
 
-def optimize(prog: Dict[str, Any]) -> Dict[str, Any]:
+def optimize(prog: Dict[str, Any], aggressive: bool = False, keep_branches: bool = False,
+             memory: bool = False) -> Dict[str, Any]:
     for func in prog['functions']:
-        optimize_function(func)
+        optimize_function(func, aggressive=aggressive, keep_branches=keep_branches, memory=memory)
     return prog
 
 if __name__ == "__main__":
     try:
-        prog = json.load(sys.stdin)
-        optimized = optimize(prog)
-        json.dump(optimized, sys.stdout, indent=2)
+        aggressive = '--aggressive' in sys.argv[1:]
+        keep_branches = '--keep-branches' in sys.argv[1:]
+        memory = '--memory' in sys.argv[1:]
+        run_function_pass(partial(optimize_function, aggressive=aggressive,
+                                  keep_branches=keep_branches, memory=memory))
     except json.JSONDecodeError:
         print("Error: Invalid JSON input", file=sys.stderr)
         sys.exit(1)
@@ -37,19 +37,19 @@
 
 echo this is cond.bril by liveness_dice.py and constant_propagation
 echo after
-cat ../../examples/test/df/cond.bril | bril2json | python3 liveness_dce.py | python3 liveness_dce.py | bril2txt
+cat ../../examples/test/df/cond.bril | bril2json | python3 liveness_dce.py --aggressive | bril2txt
 echo before
 cat ../../examples/test/df/cond.bril | bril2json | bril2txt
 
 echo this is fact.bril by liveness_dice.py and constant_propagation
 echo after
-cat ../../examples/test/df/fact.bril | bril2json | python3 liveness_dce.py | python3 liveness_dce.py | bril2txt
+cat ../../examples/test/df/fact.bril | bril2json | python3 liveness_dce.py --aggressive | bril2txt
 echo before
 cat ../../examples/test/df/fact.bril | bril2json | bril2txt
 
 echo this is cond-args.bril by liveness_dice.py and constant_propagation
 echo after
-cat ../../examples/test/df/cond-args.bril | bril2json | python3 liveness_dce.py | python3 liveness_dce.py | bril2txt
+cat ../../examples/test/df/cond-args.bril | bril2json | python3 liveness_dce.py --aggressive | bril2txt
 echo before
 cat ../../examples/test/df/cond-args.bril | bril2json | bril2txt
 
@@ -1,215 +1,200 @@
 #!/usr/bin/env python3
-import json
+import os
 import sys
-from collections import defaultdict, deque
-
-def find_basic_blocks(instrs):
-    blocks = []
-    current = []
-    
-    for instr in instrs:
-        if 'label' in instr:
-            if current:
-                blocks.append(current)
-            current = [instr]
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import instrument
+from alias import clobbers_memory
+from analysis import AnalysisManager, CFG_ANALYSES
+from bril_json import run_function_pass
+from callgraph import VALUE_OPS
+from ssa import NameSupply
+
+# Preheaders are added (and the CFG analyses rebuilt) before anything is
+# hoisted; hoisting itself only moves code between existing blocks, so the
+# analyses cached at the end are still valid
+PRESERVES = CFG_ANALYSES
+
+# Operations that can run one more time than the program asked for without
+# being observed. Calls, memory, prints and anything that can fail at run time
+# (div by zero, int2char out of range) stay where they are.
+HOISTABLE = VALUE_OPS - {'div', 'int2char'}
+
+def insert_preheader(cfg, header, outside, names):
+    # A new block that all entries into the loop go through, and nothing else
+    preheader = cfg.fresh_label(f"{header}.preheader")
+    cfg.insert_block(preheader, [], before=header)
+    for pred in outside:
+        last = cfg.blocks[pred][-1] if cfg.blocks[pred] else {}
+        if last.get('op') in ('jmp', 'br'):
+            last['labels'] = [preheader if target == header else target for target in last['labels']]
+        cfg.remove_edge(pred, header)
+        cfg.add_edge(pred, preheader)
+    cfg.add_edge(preheader, header)
+
+    # Phi inputs from outside the loop now arrive through the preheader,
+    # merged there by a phi of their own when they differ
+    for instr in cfg.blocks[header]:
+        if instr.get('op') != 'phi':
+            continue
+        incoming = [(label, arg) for label, arg in zip(instr['labels'], instr['args']) if label in outside]
+        inside = [(label, arg) for label, arg in zip(instr['labels'], instr['args']) if label not in outside]
+        if not incoming:
+            continue
+        values = {arg for _, arg in incoming}
+        if len(values) == 1 and len(incoming) == len(outside):
+            value = values.pop()
         else:
-            current.append(instr)
-            if 'op' in instr and instr['op'] in ['jmp', 'br']:
-                blocks.append(current)
-                current = []
-    
-    if current:
-        blocks.append(current)
-    
-    return blocks
-
-def build_cfg(blocks):
-    cfg = defaultdict(list)
-    labels = {}
-    rev_cfg = defaultdict(list)
-    
-    # Map labels to block indices
-    for i, block in enumerate(blocks):
-        if block and 'label' in block[0]:
-            labels[block[0]['label']] = i
-    
-    # Build forward and reverse edges
-    for i, block in enumerate(blocks):
-        if not block:
+            value = names.fresh(instr['dest'])
+            cfg.blocks[preheader].append({
+                'op': 'phi', 'dest': value, 'type': instr.get('type'),
+                'args': [arg for _, arg in incoming], 'labels': [label for label, _ in incoming],
+            })
+        instr['labels'] = [label for label, _ in inside] + [preheader]
+        instr['args'] = [arg for _, arg in inside] + [value]
+    return preheader
+
+def add_preheaders(func, cfg, forest):
+    # Reuses a block that already is a dedicated preheader
+    names = None
+    inserted = 0
+    for loop in forest:
+        if loop.preheader is not None:
             continue
-        last = block[-1]
-        if 'op' in last:
-            if last['op'] == 'jmp':
-                succ = labels[last['labels'][0]]
-                cfg[i].append(succ)
-                rev_cfg[succ].append(i)
-            elif last['op'] == 'br':
-                for label in last['labels']:
-                    succ = labels[label]
-                    cfg[i].append(succ)
-                    rev_cfg[succ].append(i)
-            elif i + 1 < len(blocks):
-                cfg[i].append(i + 1)
-                rev_cfg[i + 1].append(i)
-        elif i + 1 < len(blocks):
-            cfg[i].append(i + 1)
-            rev_cfg[i + 1].append(i)
-    
-    return cfg, rev_cfg, labels
-
-def find_dominators(cfg, entry):
-    dom = {v: set(cfg.keys()) for v in cfg}
-    dom[entry] = {entry}
-    
+        outside = [pred for pred in cfg.preds[loop.header] if pred not in loop.blocks]
+        if names is None:
+            names = NameSupply(func, cfg)
+        insert_preheader(cfg, loop.header, outside, names)
+        inserted += 1
+    instrument.count('preheaders', inserted)
+    return inserted
+
+def loops_with_preheaders(func, am):
+    # The loop forest, every loop entered only through its own preheader.
+    # Adding blocks rebuilds the analyses that depend on the CFG's shape.
+    cfg = am.get('cfg')
+    forest = am.get('loop_forest')
+    inserted = add_preheaders(func, cfg, forest)
+    if inserted:
+        am.invalidate(preserved={'cfg'})
+        forest = am.get('loop_forest')
+    return forest, inserted
+
+def hoist_loop(cfg, loop, dom, liveness, effects, alias):
+    # Moves invariant instructions into the preheader until none are left.
+    # x = op args can go when
+    #   - op is in HOISTABLE, or is a call to a total function (see
+    #     callgraph.py), or is a load that runs on every trip around the loop
+    #     from an address no store in the loop may alias, in a loop that
+    #     neither frees memory nor calls anything impure,
+    #   - no arg is assigned in the loop (any def there was hoisted already),
+    #   - this is the only assignment to x in the loop,
+    #   - x is not live into the header, so no use in the loop sees an
+    #     earlier value of x, and
+    #   - every exit the instruction does not dominate leaves x dead, so
+    #     code after the loop cannot tell it ran early.
+    blocks = cfg.blocks
+    defs = dict(loop.defs)
+    header_live = liveness.live_in[loop.header]
+    stores = [instr['args'][0] for label in loop.labels for instr in blocks[label] if instr.get('op') == 'store']
+    clobbered = any(clobbers_memory(instr, effects) for label in loop.labels for instr in blocks[label])
+
+    def invariant_load(instr, label):
+        if clobbered or any(alias.may_alias(instr['args'][0], address) for address in stores):
+            return False
+        # A load that might not have run can fail where the loop would not.
+        # In a top-tested loop that leaves only the header's loads: the body
+        # does not dominate the exit, and nothing guards the preheader.
+        return (all(dom.dominates(label, src) for src, _ in loop.exits)
+                and all(dom.dominates(label, latch) for latch in loop.latches))
+
+    def safe(instr, label):
+        dest = instr.get('dest')
+        if dest is None or defs[dest] != 1:
+            return False
+        op = instr.get('op')
+        if op == 'load':
+            if not invariant_load(instr, label):
+                return False
+        elif op not in HOISTABLE and not effects.is_total(instr):
+            return False
+        if any(defs.get(arg, 0) for arg in instr.get('args', [])):
+            return False
+        if liveness.is_live(header_live, dest):
+            return False
+        return all(dom.dominates(label, src) or not liveness.is_live(liveness.live_in[dst], dest)
+                   for src, dst in loop.exits)
+
+    # Dominators come first in reverse postorder, so chains of invariant
+    # instructions mostly go in one sweep; the loop catches the rest
+    order = [label for label in dom.rpo if label in loop.blocks]
+    hoisted = []
     changed = True
     while changed:
         changed = False
-        for node in cfg:
-            if node == entry:
-                continue
-            preds = [p for p in cfg if node in cfg[p]]
-            if not preds:
-                continue
-            new_dom = {node} | set.intersection(*(dom[p] for p in preds))
-            if new_dom != dom[node]:
-                dom[node] = new_dom
-                changed = True
-    
-    return dom
-
-def find_loops(cfg, rev_cfg, dom):
-    loops = []
-    visited = set()
-    
-    def find_loop_body(header, back_edge_source):
-        body = {back_edge_source}
-        stack = [back_edge_source]
-        
-        while stack:
-            node = stack.pop()
-            for pred in rev_cfg[node]:
-                if pred != header and pred not in body:
-                    body.add(pred)
-                    stack.append(pred)
-        
-        body.add(header)
-        return body
-
-    # Find natural loops
-    for header in cfg:
-        for pred in rev_cfg[header]:
-            if header in dom[pred] and (header, pred) not in visited:
-                # Found a back edge
-                visited.add((header, pred))
-                loop_body = find_loop_body(header, pred)
-                
-                # Find preheader
-                preheader = None
-                preds = [p for p in rev_cfg[header] if p not in loop_body]
-                if preds:
-                    preheader = preds[0]
-                
-                if preheader is not None:
-                    loops.append((header, loop_body, preheader))
-    
-    return loops
-
-def is_loop_invariant(instr, loop_blocks, defs_in_loop):
-    if 'op' not in instr:
-        return False
-    
-    # Constants are always invariant
-    if instr['op'] == 'const':
-        return True
-    
-    # Never move memory operations, calls, or control flow
-    if instr['op'] in ['load', 'store', 'call', 'print', 'br', 'jmp', 'ret']:
-        return False
-    
-    # Never move phi nodes
-    if instr['op'] == 'phi':
-        return False
-    
-    # For other operations, check if all arguments are loop-invariant
-    if 'args' in instr:
-        return not any(arg in defs_in_loop for arg in instr['args'])
-    
-    return True
-
-def process_function(func):
+        for label in order:
+            remaining_instrs = []
+            for instr in blocks[label]:
+                if safe(instr, label):
+                    hoisted.append(instr)
+                    defs[instr['dest']] -= 1
+                    changed = True
+                else:
+                    remaining_instrs.append(instr)
+            if len(remaining_instrs) != len(blocks[label]):
+                blocks[label] = remaining_instrs
+
+    if hoisted:
+        instrument.count('hoisted', len(hoisted))
+        instrument.count('loads_hoisted', sum(1 for instr in hoisted if instr.get('op') == 'load'))
+        block = blocks[loop.preheader]
+        insert_pos = len(block)
+        if block and block[-1].get('op') in ('jmp', 'br'):
+            insert_pos -= 1
+        block[insert_pos:insert_pos] = hoisted
+    return bool(hoisted)
+
+def process_function(func, am=None):
     if 'instrs' not in func:
         return func
-    
-    blocks = find_basic_blocks(func['instrs'])
-    if not blocks:
+
+    standalone = am is None
+    if standalone:
+        am = AnalysisManager(func)
+
+    cfg = am.get('cfg')
+    if not cfg.blocks:
         return func
-    
-    cfg, rev_cfg, labels = build_cfg(blocks)
-    
-    # Find entry block
-    entry = 0
-    for i, block in enumerate(blocks):
-        if block and 'label' in block[0] and block[0]['label'] == func['name']:
-            entry = i
-            break
-    
-    dom = find_dominators(cfg, entry)
-    loops = find_loops(cfg, rev_cfg, dom)
-    
-    if not loops:
+
+    forest, modified = loops_with_preheaders(func, am)
+    if not len(forest):
         return func
-    
-    # Process loops from innermost to outermost
-    modified = False
-    for header, loop_body, preheader in sorted(loops, key=lambda x: len(x[1]), reverse=True):
-        # Find all definitions in the loop
-        defs_in_loop = set()
-        for block_id in loop_body:
-            for instr in blocks[block_id]:
-                if 'dest' in instr:
-                    defs_in_loop.add(instr['dest'])
-        
-        # Find and move invariant instructions
-        for block_id in loop_body:
-            invariant_instrs = []
-            remaining_instrs = []
-            
-            for instr in blocks[block_id]:
-                if is_loop_invariant(instr, loop_body, defs_in_loop):
-                    invariant_instrs.append(instr)
-                    if 'dest' in instr:
-                        defs_in_loop.remove(instr['dest'])
-                else:
-                    remaining_instrs.append(instr)
-            
-            if invariant_instrs:
-                modified = True
-                blocks[block_id] = remaining_instrs
-                
-                # Insert at the appropriate position in preheader
-                insert_pos = len(blocks[preheader])
-                for i, instr in enumerate(blocks[preheader]):
-                    if 'op' in instr and instr['op'] in ['jmp', 'br']:
-                        insert_pos = i
-                        break
-                
-                blocks[preheader][insert_pos:insert_pos] = invariant_instrs
-    
-    if modified:
+
+    # Innermost loops first: what leaves an inner loop lands in its
+    # preheader, which belongs to the enclosing loop and is looked at again
+    # there. Moving code within the enclosing loop leaves its def summary
+    # as it was. Liveness is computed once; moving a definition into a
+    # preheader can only shrink liveness outside that loop, so later checks
+    # err on the safe side.
+    dom = am.get('dominators')
+    liveness = am.get('liveness')
+    alias = am.get('points_to')
+    for loop in forest.postorder():
+        if hoist_loop(cfg, loop, dom, liveness, am.effects, alias):
+            modified = True
+
+    if modified and standalone:
         # Reconstruct function instructions
-        func['instrs'] = [instr for block in blocks for instr in block]
-    
+        am.sync()
+
     return func
 
 def main():
     try:
-        prog = json.load(sys.stdin)
-        if 'functions' in prog:
-            prog['functions'] = [process_function(f) for f in prog['functions']]
-        json.dump(prog, sys.stdout)
+        run_function_pass(process_function)
     except Exception as e:
         print(f"Error: {e}", file=sys.stderr)
         sys.exit(1)
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
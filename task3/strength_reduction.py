@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import instrument
+from analysis import AnalysisManager, CFG_ANALYSES
+from bril_json import run_function_pass
+from dataflow import Liveness
+from licm import loops_with_preheaders
+from ssa import NameSupply
+
+# Like LICM: preheaders first, then code only moves between existing blocks
+PRESERVES = CFG_ANALYSES
+
+INT_MIN = -2 ** 63
+INT_MAX = 2 ** 63 - 1
+
+# i < n is n > i, and so on
+MIRRORED = {'lt': 'gt', 'gt': 'lt', 'le': 'ge', 'ge': 'le'}
+
+class InductionVariables:
+    # For one loop:
+    #   basic    i = i + s or i = i - s, with s invariant, as the only
+    #            assignment to i in the loop:
+    #            i -> (label, instruction, s, +1 or -1)
+    #   derived  j = i * c, i + c, c + i or i - c with i basic and c
+    #            invariant, as the only assignment to j in the loop:
+    #            j -> (label, instruction, i, op, c)
+    # A variable is invariant when the loop never assigns it. The loop is
+    # rescanned rather than read from the forest's def summary, which does
+    # not know about code added for the loops nested inside it.
+    def __init__(self, cfg, loop):
+        self.sites = {}     # variable -> [(label, instruction)] assigning it in the loop
+        for label in loop.labels:
+            for instr in cfg.blocks[label]:
+                if 'dest' in instr:
+                    self.sites.setdefault(instr['dest'], []).append((label, instr))
+
+        self.basic = {}
+        for var, sites in self.sites.items():
+            if len(sites) == 1:
+                label, instr = sites[0]
+                step = self.basic_step(var, instr)
+                if step is not None:
+                    self.basic[var] = (label, instr) + step
+
+        self.derived = {}
+        for var, sites in self.sites.items():
+            if len(sites) == 1 and var not in self.basic:
+                label, instr = sites[0]
+                linear = self.linear(instr)
+                if linear is not None:
+                    self.derived[var] = (label, instr) + linear
+
+    def invariant(self, var):
+        return var not in self.sites
+
+    def basic_step(self, var, instr):
+        op, args = instr.get('op'), instr.get('args', [])
+        if op not in ('add', 'sub') or len(args) != 2:
+            return None
+        a, b = args
+        if a == var and b != var and self.invariant(b):
+            return b, 1 if op == 'add' else -1
+        if op == 'add' and b == var and a != var and self.invariant(a):
+            return a, 1
+        return None
+
+    def linear(self, instr):
+        op, args = instr.get('op'), instr.get('args', [])
+        if op not in ('add', 'sub', 'mul') or len(args) != 2:
+            return None
+        a, b = args
+        if a in self.basic and self.invariant(b):
+            return a, op, b
+        if op != 'sub' and b in self.basic and self.invariant(a):
+            return b, op, a
+        return None
+
+def constant_values(cfg):
+    # Variables whose every assignment is the same integer constant
+    values = {}
+    for block in cfg.blocks.values():
+        for instr in block:
+            dest = instr.get('dest')
+            if dest is None:
+                continue
+            value = instr.get('value') if instr.get('op') == 'const' and instr.get('type') == 'int' else None
+            if values.get(dest, value) != value:
+                value = None
+            values[dest] = value
+    return {var: value for var, value in values.items() if value is not None}
+
+def wrap(value):
+    return (value - INT_MIN) % 2 ** 64 + INT_MIN
+
+def fits(*values):
+    return all(INT_MIN <= value <= INT_MAX for value in values)
+
+class LoopReducer:
+    def __init__(self, func, cfg, loop, dom, names, defined, constants):
+        self.cfg = cfg
+        self.loop = loop
+        self.loop_body = loop.blocks
+        self.inner = set()      # blocks of the loops nested inside this one
+        for child in loop.children:
+            self.inner |= child.blocks
+        self.dom = dom
+        self.names = names
+        self.constants = constants
+        self.preheader = loop.preheader
+        self.params = {arg['name'] for arg in func.get('args', [])}
+        self.entry_defined = defined.defined_out[self.preheader]
+        self.defined = defined
+        self.ivs = InductionVariables(cfg, loop)
+        self.setup = []         # instructions for the preheader
+        self.replacements = {}  # id(instruction) -> instruction to use instead
+        self.after = {}         # id(update of i) -> instructions to add after it
+        self.reduced = {}       # (i, c) -> t, kept equal to i * c throughout the loop
+
+    def available(self, *names):
+        # Has a value when the preheader runs, so setup code can read it
+        return all(self.defined.is_defined(self.entry_defined, name) for name in names)
+
+    def reduce(self):
+        # j = i * c becomes j = id t, where t starts as i * c in the preheader
+        # and grows by s * c right after each i = i + s. Wrapping arithmetic
+        # keeps t == i * c exactly, overflow or not.
+        # t's update runs as often as i's, so only muls that run at least as
+        # often are worth it: those on every trip around the loop, and those
+        # in inner loops
+        latches = self.loop.latches
+        for j, (label, instr, i, op, c) in self.ivs.derived.items():
+            _, update, step, sign = self.ivs.basic[i]
+            if op != 'mul' or not self.available(i, c, step):
+                continue
+            if label not in self.inner and not all(self.dom.dominates(label, latch) for latch in latches):
+                continue
+            t = self.reduced.get((i, c))
+            if t is None:
+                t = self.names.fresh(f"{i}.x.{c}")
+                self.setup.append({'dest': t, 'type': 'int', 'op': 'mul', 'args': [i, c]})
+                delta = self.scaled_step(step, c, t)
+                self.after.setdefault(id(update), []).append(
+                    {'dest': t, 'type': 'int', 'op': 'add' if sign > 0 else 'sub', 'args': [t, delta]})
+                self.reduced[(i, c)] = t
+            self.replacements[id(instr)] = {'dest': j, 'type': instr.get('type', 'int'), 'op': 'id', 'args': [t]}
+            instrument.count('reduced')
+
+    def scaled_step(self, step, c, t):
+        # s * c, folded when the operands are known
+        if self.constants.get(step) == 1:
+            return c
+        if self.constants.get(c) == 1:
+            return step
+        delta = self.names.fresh(f"{t}.step")
+        if step in self.constants and c in self.constants:
+            product = wrap(self.constants[step] * self.constants[c])
+            self.setup.append({'dest': delta, 'type': 'int', 'op': 'const', 'value': product})
+        else:
+            self.setup.append({'dest': delta, 'type': 'int', 'op': 'mul', 'args': [step, c]})
+        return delta
+
+    def replace_tests(self):
+        # Linear-function test replacement: the exit test i < n becomes
+        # t < n * c for a reduced t = i * c, so i may end up unused. That is
+        # only exact if neither product overflows, so it is done when c, the
+        # step and i's starting values are constants, c > 0, and the test
+        # bounds every value i can take:
+        #   - it decides the branch that leaves the loop, in a block that
+        #     every trip around the loop passes through,
+        #   - i moves towards n, by at most one step between two tests (its
+        #     update is not in an inner loop), and
+        #   - the range that leaves for i, times c, fits in 64 bits.
+        latches = self.loop.latches
+        for i, (update_label, update, step, sign) in self.ivs.basic.items():
+            candidates = [(c, t) for (iv, c), t in self.reduced.items() if iv == i and self.constants.get(c, 0) > 0]
+            inits = self.initial_values(i, update)
+            if not candidates or inits is None or step not in self.constants or update_label in self.inner:
+                continue
+            c, t = candidates[0]
+            factor, stride = self.constants[c], self.constants[step] * sign
+            for label in self.loop.labels:
+                if not all(self.dom.dominates(label, latch) for latch in latches):
+                    continue
+                found = self.exit_test(label, i)
+                if found is None:
+                    continue
+                instr, op, bound, stays = found
+                limit = self.constants.get(bound)
+                if limit is None or id(instr) in self.replacements:
+                    continue
+                # The loop keeps going while i < n (or <=, >, >=)
+                keeps_below = (op in ('lt', 'le')) == stays
+                if keeps_below and stride > 0:
+                    low, high = min(inits), max(inits + [limit]) + stride
+                elif not keeps_below and stride < 0:
+                    low, high = min(inits + [limit]) + stride, max(inits)
+                else:
+                    continue
+                if not fits(low * factor, high * factor, limit * factor):
+                    continue
+                scaled = self.names.fresh(f"{bound}.x.{c}")
+                self.setup.append({'dest': scaled, 'type': 'int', 'op': 'const', 'value': limit * factor})
+                self.replacements[id(instr)] = {'dest': instr['dest'], 'type': 'bool', 'op': op,
+                                                'args': [t, scaled]}
+                instrument.count('tests_replaced')
+
+    def exit_test(self, label, i):
+        # (comparison, op, n, stays) when the block ends in a branch on
+        # `i op n` that leaves the loop; stays is the outcome that does not
+        block = self.cfg.blocks[label]
+        last = block[-1] if block else {}
+        if last.get('op') != 'br':
+            return None
+        cond = last['args'][0]
+        taken, other = last['labels']
+        if (taken in self.loop_body) == (other in self.loop_body):
+            return None
+        for instr in reversed(block[:-1]):
+            if instr.get('dest') == cond:
+                test = self.test_of(instr, i)
+                if test is None:
+                    return None
+                return (instr,) + test + (taken in self.loop_body,)
+        return None
+
+    def test_of(self, instr, i):
+        # (op, n) for a comparison that reads as `i op n` with n invariant
+        op, args = instr.get('op'), instr.get('args', [])
+        if op not in MIRRORED or len(args) != 2 or 'dest' not in instr:
+            return None
+        a, b = args
+        if a == i and b != i and self.ivs.invariant(b):
+            return op, b
+        if b == i and a != i and self.ivs.invariant(a):
+            return MIRRORED[op], a
+        return None
+
+    def initial_values(self, i, update):
+        # Constant values i can have on entry, or None if they are unknown
+        if i in self.params:
+            return None
+        values = []
+        for block in self.cfg.blocks.values():
+            for instr in block:
+                if instr is update or instr.get('dest') != i:
+                    continue
+                if instr.get('op') != 'const' or instr.get('type') != 'int':
+                    return None
+                values.append(instr['value'])
+        return values or None
+
+    def rewrite(self):
+        # Apply the replacements and updates. A use of j = id t later in the
+        # same block reads t directly while neither is reassigned, so that j
+        # itself often becomes dead.
+        blocks = self.cfg.blocks
+        for label in self.loop.labels:
+            block = []
+            copies = {}
+            for original in blocks[label]:
+                instr = self.replacements.get(id(original), original)
+                args = instr.get('args')
+                if copies and args and any(arg in copies for arg in args):
+                    instr['args'] = [copies.get(arg, arg) for arg in args]
+                block.append(instr)
+                dest = instr.get('dest')
+                if dest is not None:
+                    copies = {j: t for j, t in copies.items() if dest not in (j, t)}
+                    if instr.get('op') == 'id' and id(original) in self.replacements and dest != instr['args'][0]:
+                        copies[dest] = instr['args'][0]
+                for added in self.after.get(id(original), ()):
+                    block.append(added)
+                    copies = {j: t for j, t in copies.items() if added['dest'] not in (j, t)}
+            blocks[label] = block
+
+        block = blocks[self.preheader]
+        insert_pos = len(block)
+        if block and block[-1].get('op') in ('jmp', 'br'):
+            insert_pos -= 1
+        block[insert_pos:insert_pos] = self.setup
+
+    def eliminate(self):
+        # A basic induction variable that is now only read by its own update,
+        # and is dead once the loop exits, is redundant
+        blocks = self.cfg.blocks
+        candidates = []
+        for i, (label, update, _, _) in self.ivs.basic.items():
+            used = any(i in instr.get('args', ()) for l in self.loop_body for instr in blocks[l]
+                       if instr is not update)
+            if not used:
+                candidates.append((i, label, update))
+        if not candidates:
+            return
+        liveness = Liveness(self.cfg)
+        for i, label, update in candidates:
+            if any(liveness.is_live(liveness.live_in[succ], i) for succ in self.loop.exit_blocks):
+                continue
+            blocks[label] = [instr for instr in blocks[label] if instr is not update]
+            instrument.count('ivs_eliminated')
+
+def strength_reduce(func, am=None):
+    if 'instrs' not in func:
+        return func
+
+    standalone = am is None
+    if standalone:
+        am = AnalysisManager(func)
+
+    cfg = am.get('cfg')
+    forest, modified = loops_with_preheaders(func, am)
+
+    # Innermost first, so an outer loop sees the inner loops' new setup code
+    # in their preheaders. Added code only defines fresh variables, so the
+    # defined-variables and constant facts gathered up front stay true for
+    # everything they are asked about.
+    if len(forest):
+        names = NameSupply(func, cfg)
+        dom = am.get('dominators')
+        defined = am.get('defined_variables')
+        constants = constant_values(cfg)
+        for loop in forest.postorder():
+            reducer = LoopReducer(func, cfg, loop, dom, names, defined, constants)
+            reducer.reduce()
+            if not reducer.reduced:
+                continue
+            reducer.replace_tests()
+            reducer.rewrite()
+            reducer.eliminate()
+            modified = True
+
+    if modified and standalone:
+        am.sync()
+    return func
+
+if __name__ == '__main__':
+    run_function_pass(strength_reduce)
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import instrument
+from analysis import AnalysisManager
+from bril_json import run_function_pass
+from callgraph import callee_of
+from ssa import NameSupply, has_phis
+
+# Adds an entry block and turns returns into jumps
+PRESERVES = ()
+
+def tail_call(block, name):
+    # Index of a call to `name` whose result (if any) the block returns
+    # right away, possibly through a chain of copies; None if there is none
+    last = block[-1] if block else {}
+    if last.get('op') != 'ret':
+        return None
+    result = last['args'][0] if last.get('args') else None
+    i = len(block) - 2
+    while i >= 0 and result is not None and block[i].get('op') == 'id' and block[i]['dest'] == result:
+        result = block[i]['args'][0]
+        i -= 1
+    if i < 0 or callee_of(block[i]) != name:
+        return None
+    if result is not None and block[i].get('dest') != result:
+        return None
+    return i
+
+def parallel_copy(params, args, names):
+    # Assigns every parameter its new value as if all at once: a parameter
+    # read after it was overwritten is saved in a temporary first
+    moves = [(param, arg) for param, arg in zip(params, args) if param['name'] != arg]
+    position = {param['name']: k for k, (param, _) in enumerate(moves)}
+    saves, copies = [], []
+    saved = {}
+    for k, (param, arg) in enumerate(moves):
+        if position.get(arg, k) < k:
+            if arg not in saved:
+                saved[arg] = names.fresh(arg)
+                saves.append({'dest': saved[arg], 'type': moves[position[arg]][0]['type'],
+                              'op': 'id', 'args': [arg]})
+            arg = saved[arg]
+        copies.append({'dest': param['name'], 'type': param['type'], 'op': 'id', 'args': [arg]})
+    return saves + copies
+
+def eliminate_tail_calls(func, am):
+    # Every self call in tail position becomes new parameter values and a
+    # jump back to the top of the function, behind a fresh entry block so
+    # that the loop this makes has a preheader. Phis are left alone: on SSA
+    # code the parameters would be assigned twice, so run this before to_ssa.
+    cfg = am.get('cfg')
+    name = func['name']
+    params = func.get('args', [])
+    if has_phis(cfg):
+        return False
+
+    # A site is rewritten only when its copies and jump run no more
+    # instructions than the call, the copies of its result and the ret they
+    # replace; shuffled parameters can need more
+    names = NameSupply(func, cfg)
+    sites = []
+    for label, block in cfg.blocks.items():
+        i = tail_call(block, name)
+        if i is None or len(block[i].get('args', [])) != len(params):
+            continue
+        moves = parallel_copy(params, block[i]['args'], names)
+        if len(moves) + 1 <= len(block) - i:
+            sites.append((label, i, moves))
+    if not sites:
+        return False
+
+    header = cfg.entry
+    entry = cfg.fresh_label(f"{name}.entry")
+    cfg.insert_block(entry, [], before=header)
+    cfg.synthetic.discard(entry)       # the entry must not be the loop header's label
+    cfg.add_edge(entry, header)
+
+    for label, i, moves in sites:
+        block = cfg.blocks[label]
+        cfg.blocks[label] = block[:i] + moves + [{'op': 'jmp', 'labels': [header]}]
+        cfg.add_edge(label, header)
+    instrument.count('tail_calls', len(sites))
+    return True
+
+def process_function(func, am=None):
+    if 'instrs' not in func:
+        return func
+
+    standalone = am is None
+    if standalone:
+        am = AnalysisManager(func)
+
+    if eliminate_tail_calls(func, am) and standalone:
+        am.sync()
+    return func
+
+def main():
+    try:
+        run_function_pass(process_function)
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
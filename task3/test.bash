@@ -33,4 +33,12 @@ echo "=== Testing to_SSA Examples ==="
 echo "********************************"
 for file in $BASE_DIR/to_ssa/*.bril; do
     test_file "$file"
-done
\ No newline at end of file
+done
+echo "=== Testing generated stress shapes ==="
+echo "********************************"
+for shape in chain nest switch loops random; do
+    echo "Testing shape: $shape"
+    echo "===================="
+    python3 ../common/bril_gen.py --shape $shape --size 6 --seed 1 | python3 licm.py | bril2txt
+    echo
+done
@@ -0,0 +1,13 @@
+import os
+import sys
+
+# Lets the tests import the modules in common/ the way the task scripts do
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+PTR = {'ptr': 'int'}
+
+def const(dest, value, type='int'):
+    return {'dest': dest, 'type': type, 'op': 'const', 'value': value}
+
+def call(dest, func, *args):
+    return {'dest': dest, 'type': 'int', 'op': 'call', 'funcs': [func], 'args': list(args)}
@@ -0,0 +1,80 @@
+import copy
+
+from bril_helpers import PTR, const
+from alias import PointsTo
+from cfg import CFG
+from interp import run_program
+from loops import cyclic_blocks
+from pipeline import run_pipeline
+
+def irreducible_alloc():
+    # .A and .B form a cycle with two entries, so it is no natural loop; the
+    # alloc in .A still runs on every trip, and q keeps the previous object
+    return {'name': 'main', 'instrs': [
+        const('one', 1),
+        const('two', 2),
+        const('x', 11),
+        const('y', 22),
+        const('i', 0),
+        const('c', True, 'bool'),
+        {'op': 'br', 'args': ['c'], 'labels': ['A', 'B']},
+        {'label': 'A'},
+        {'dest': 'p', 'type': PTR, 'op': 'alloc', 'args': ['one']},
+        {'dest': 'i', 'type': 'int', 'op': 'add', 'args': ['i', 'one']},
+        {'dest': 'done', 'type': 'bool', 'op': 'eq', 'args': ['i', 'two']},
+        {'op': 'br', 'args': ['done'], 'labels': ['use', 'save']},
+        {'label': 'save'},
+        {'dest': 'q', 'type': PTR, 'op': 'id', 'args': ['p']},
+        {'op': 'store', 'args': ['q', 'x']},
+        {'op': 'jmp', 'labels': ['B']},
+        {'label': 'B'},
+        {'op': 'jmp', 'labels': ['A']},
+        {'label': 'use'},
+        {'op': 'store', 'args': ['p', 'y']},
+        {'dest': 'v', 'type': 'int', 'op': 'load', 'args': ['q']},
+        {'op': 'print', 'args': ['v']},
+        {'op': 'free', 'args': ['p']},
+        {'op': 'free', 'args': ['q']},
+    ]}
+
+def points_to_of(func):
+    cfg = CFG(func)
+    return PointsTo(cfg, [], cyclic_blocks(cfg))
+
+def test_alloc_in_irreducible_cycle_is_a_summary():
+    func = irreducible_alloc()
+    points_to = points_to_of(func)
+    assert points_to.summary == set(points_to.sites)
+    assert points_to.may_alias('p', 'q')
+    assert not points_to.must_alias('p', 'q')
+
+def test_alloc_outside_cycles_is_one_object():
+    func = {'name': 'main', 'instrs': [
+        const('one', 1),
+        {'dest': 'p', 'type': PTR, 'op': 'alloc', 'args': ['one']},
+        {'dest': 'q', 'type': PTR, 'op': 'id', 'args': ['p']},
+        {'op': 'free', 'args': ['q']},
+    ]}
+    points_to = points_to_of(func)
+    assert not points_to.summary
+    assert points_to.must_alias('p', 'q')
+
+def test_cyclic_blocks_count_self_edges_and_skip_the_rest():
+    func = {'name': 'main', 'instrs': [
+        const('t', True),
+        {'label': 'spin'},
+        {'op': 'br', 'args': ['t'], 'labels': ['spin', 'out']},
+        {'label': 'out'},
+        {'op': 'ret'},
+    ]}
+    cfg = CFG(func)
+    assert cyclic_blocks(cfg) == {'spin'}
+    assert cyclic_blocks(CFG(irreducible_alloc())) == {'A', 'save', 'B'}
+
+def test_memory_dce_keeps_store_read_on_a_later_trip():
+    # `store q x` writes the object of the first trip through .A; `store p y`
+    # writes the second one, so the load of q still sees 11
+    prog = {'functions': [irreducible_alloc()]}
+    expected, _ = run_program(copy.deepcopy(prog))
+    result = run_pipeline(prog, ['memory_dce'])
+    assert run_program(result)[0] == expected == ['11']
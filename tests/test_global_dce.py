@@ -0,0 +1,21 @@
+import os
+import sys
+
+from bril_helpers import call, const
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'task1'))
+from global_dce import global_dce
+
+def test_unused_total_call_is_deleted():
+    sq = {'name': 'sq', 'args': [{'name': 'x', 'type': 'int'}], 'type': 'int', 'instrs': [
+        {'dest': 'r', 'type': 'int', 'op': 'mul', 'args': ['x', 'x']},
+        {'op': 'ret', 'args': ['r']},
+    ]}
+    main = {'name': 'main', 'instrs': [
+        const('x', 3),
+        call('v', 'sq', 'x'),
+        {'dest': 'w', 'type': 'int', 'op': 'add', 'args': ['x', 'x']},
+        {'op': 'print', 'args': ['x']},
+    ]}
+    prog = global_dce({'functions': [sq, main]})
+    assert [instr.get('op') for instr in prog['functions'][1]['instrs']] == ['const', 'print']
@@ -0,0 +1,70 @@
+import copy
+
+from bril_helpers import call, const
+from inline import inline_program, size
+from interp import run_program
+from pipeline import run_pipeline
+
+def add_one(name):
+    return {'name': name, 'args': [{'name': 'x', 'type': 'int'}], 'type': 'int', 'instrs': [
+        const('one', 1),
+        {'dest': 'r', 'type': 'int', 'op': 'add', 'args': ['x', 'one']},
+        {'op': 'ret', 'args': ['r']},
+    ]}
+
+def test_phi_after_two_calls_in_one_block():
+    # Both calls in .L are inlined; the phi in .M must name the piece of .L
+    # after the second one
+    main = {'name': 'main', 'instrs': [
+        const('a', 1),
+        const('c', True, 'bool'),
+        {'op': 'br', 'args': ['c'], 'labels': ['L', 'O']},
+        {'label': 'L'},
+        call('b', 'f', 'a'),
+        call('d', 'f', 'b'),
+        {'op': 'jmp', 'labels': ['M']},
+        {'label': 'O'},
+        const('e', 7),
+        {'op': 'jmp', 'labels': ['M']},
+        {'label': 'M'},
+        {'dest': 'v', 'type': 'int', 'op': 'phi', 'args': ['d', 'e'], 'labels': ['L', 'O']},
+        {'op': 'print', 'args': ['v']},
+    ]}
+    prog = {'functions': [add_one('f'), main]}
+    expected, _ = run_program(copy.deepcopy(prog))
+    inlined = run_pipeline(prog, ['inline'])
+    assert [func['name'] for func in inlined['functions']] == ['main']
+    assert run_program(inlined)[0] == expected == ['3']
+
+def test_growth_stays_within_budget():
+    # g is used once, inside f, and f is copied into every call in main: the
+    # copies of g's body, and the copies of f's parameter and of its two
+    # rets, must all be paid for
+    g = {'name': 'g', 'args': [{'name': 'x', 'type': 'int'}], 'type': 'int', 'instrs':
+         [const(f'k{i}', i) for i in range(4)]
+         + [{'dest': 'x', 'type': 'int', 'op': 'add', 'args': ['x', f'k{i}']} for i in range(4)]
+         + [{'op': 'ret', 'args': ['x']}]}
+    f = {'name': 'f', 'args': [{'name': 'x', 'type': 'int'}], 'type': 'int', 'instrs': [
+        call('x', 'g', 'x'),
+        const('zero', 0),
+        {'dest': 'c', 'type': 'bool', 'op': 'lt', 'args': ['x', 'zero']},
+        {'op': 'br', 'args': ['c'], 'labels': ['neg', 'pos']},
+        {'label': 'neg'},
+        {'op': 'ret', 'args': ['zero']},
+        {'label': 'pos'},
+        {'op': 'ret', 'args': ['x']},
+    ]}
+    instrs = [const('v0', 0)]
+    for i in range(8):
+        instrs.append(call(f'v{i + 1}', 'f', f'v{i}'))
+    instrs.append({'op': 'print', 'args': ['v8']})
+    prog = {'functions': [g, f, {'name': 'main', 'instrs': instrs}]}
+    expected, _ = run_program(copy.deepcopy(prog))
+    before = sum(size(func) for func in prog['functions'])
+
+    for tenths in range(21):
+        growth = tenths / 10
+        result = inline_program(copy.deepcopy(prog), growth=growth)
+        after = sum(size(func) for func in result['functions'])
+        assert after <= before + int(before * growth)
+        assert run_program(result)[0] == expected
@@ -0,0 +1,42 @@
+import copy
+
+from bril_helpers import PTR, const
+from cfg import CFG
+from interp import run_program
+from pipeline import run_pipeline
+
+def test_loop_bound_load_leaves_loop():
+    # while i < *a: a[1] = i; i += 1. The store is to another cell of the
+    # same object, so the header's load of the bound is invariant.
+    main = {'name': 'main', 'instrs': [
+        const('zero', 0),
+        const('one', 1),
+        const('two', 2),
+        const('three', 3),
+        {'dest': 'a', 'type': PTR, 'op': 'alloc', 'args': ['two']},
+        {'dest': 'b', 'type': PTR, 'op': 'ptradd', 'args': ['a', 'one']},
+        {'op': 'store', 'args': ['a', 'three']},
+        {'op': 'store', 'args': ['b', 'zero']},
+        {'dest': 'i', 'type': 'int', 'op': 'id', 'args': ['zero']},
+        {'label': 'head'},
+        {'dest': 'n', 'type': 'int', 'op': 'load', 'args': ['a']},
+        {'dest': 'c', 'type': 'bool', 'op': 'lt', 'args': ['i', 'n']},
+        {'op': 'br', 'args': ['c'], 'labels': ['body', 'done']},
+        {'label': 'body'},
+        {'op': 'store', 'args': ['b', 'i']},
+        {'dest': 'i', 'type': 'int', 'op': 'add', 'args': ['i', 'one']},
+        {'op': 'jmp', 'labels': ['head']},
+        {'label': 'done'},
+        {'dest': 'v', 'type': 'int', 'op': 'load', 'args': ['b']},
+        {'op': 'print', 'args': ['v']},
+        {'op': 'free', 'args': ['a']},
+    ]}
+    prog = {'functions': [main]}
+    expected, before = run_program(copy.deepcopy(prog))
+    result = run_pipeline(prog, ['licm'])
+
+    cfg = CFG(result['functions'][0])
+    assert [instr for instr in cfg.blocks['head'] if instr.get('op') == 'load'] == []
+    output, after = run_program(result)
+    assert output == expected == ['2']
+    assert after['total_dyn_inst'] < before['total_dyn_inst']
@@ -0,0 +1,55 @@
+import copy
+
+from bril_helpers import call, const
+from interp import run_program
+from pipeline import run_pipeline
+
+INT = 'int'
+
+def param(name):
+    return {'name': name, 'type': INT}
+
+def recursive(name, params, next_args):
+    # name(params...): returns the first parameter once n reaches 0, else
+    # calls itself on next_args with n - 1 in tail position
+    return {'name': name, 'args': [param(p) for p in params], 'type': INT, 'instrs': [
+        const('zero', 0),
+        const('one', 1),
+        {'dest': 'done', 'type': 'bool', 'op': 'eq', 'args': ['n', 'zero']},
+        {'op': 'br', 'args': ['done'], 'labels': ['base', 'step']},
+        {'label': 'base'},
+        {'op': 'ret', 'args': [params[0]]},
+        {'label': 'step'},
+        {'dest': 'm', 'type': INT, 'op': 'sub', 'args': ['n', 'one']},
+        call('r', name, *next_args),
+        {'op': 'ret', 'args': ['r']},
+    ]}
+
+def program(func, *args):
+    instrs = [const(f'a{i}', value) for i, value in enumerate(args)]
+    instrs.append(call('v', func['name'], *[f'a{i}' for i in range(len(args))]))
+    instrs.append({'op': 'print', 'args': ['v']})
+    return {'functions': [func, {'name': 'main', 'instrs': instrs}]}
+
+def optimize(prog):
+    expected, before = run_program(copy.deepcopy(prog))
+    result = run_pipeline(prog, ['tail_recursion'])
+    output, after = run_program(copy.deepcopy(result))
+    assert output == expected
+    assert after['total_dyn_inst'] <= before['total_dyn_inst']
+    return result
+
+def calls_in(prog, name):
+    func = next(func for func in prog['functions'] if func['name'] == name)
+    return [instr for instr in func['instrs'] if instr.get('op') == 'call']
+
+def test_countdown_becomes_a_loop():
+    # n goes down, the rest stays: one copy and a jump for the call and ret
+    result = optimize(program(recursive('count', ['n'], ['m']), 50))
+    assert calls_in(result, 'count') == []
+
+def test_swapped_parameters_stay_a_call():
+    # Swapping a and b each step takes a temporary and three copies, more
+    # than the call and ret it would replace
+    result = optimize(program(recursive('swap', ['a', 'b', 'n'], ['b', 'a', 'm']), 7, 8, 51))
+    assert len(calls_in(result, 'swap')) == 1